@@ -0,0 +1,386 @@
+"""
+离线压测：在本地启动模拟服务（fixture站点/firecrawl/LLM/S3）和被测服务，
+按不同并发度压测 /site/crawl 与 /site/crawl_async，输出延迟分位数、吞吐、峰值内存和各阶段耗时。
+
+用法（在项目根目录执行）：
+    python -m benchmark.run_benchmark --concurrency 1,4,16 --requests 32
+    python -m benchmark.run_benchmark --mode crawl,async --fetch browser --output result.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import psutil
+import uvicorn
+from fastapi import FastAPI, Request
+
+# 设置日志
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(filename)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(percent / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class RSSSampler:
+    # 后台线程定时采样被测进程及其子进程（uvicorn worker、Chromium）的总RSS，记录峰值
+    def __init__(self, pid, interval=0.2):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak = 0
+        self.running = False
+        self.thread = None
+
+    def sample(self):
+        total = 0
+        for process in [self.process] + self.process.children(recursive=True):
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+
+    def run(self):
+        while self.running:
+            try:
+                self.peak = max(self.peak, self.sample())
+            except psutil.Error:
+                pass
+            time.sleep(self.interval)
+
+    def start(self):
+        self.peak = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        return round(self.peak / 1024 / 1024, 1)
+
+
+class CallbackReceiver:
+    # 接收异步任务回调，记录每个请求回调到达的时间
+    def __init__(self, port):
+        self.port = port
+        self.waiters = {}
+        self.results = {}
+        self.app = FastAPI()
+        self.app.post('/callback/{token}')(self.receive)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host='127.0.0.1', port=port, log_level='warning'))
+        self.task = None
+
+    async def receive(self, token: str, request: Request):
+        body = await request.json()
+        self.results[token] = body
+        waiter = self.waiters.get(token)
+        if waiter and not waiter.done():
+            waiter.set_result(time.perf_counter())
+        return {'code': 200}
+
+    def url(self, token):
+        return f"http://127.0.0.1:{self.port}/callback/{token}"
+
+    def expect(self, token):
+        self.waiters[token] = asyncio.get_running_loop().create_future()
+        return self.waiters[token]
+
+    async def start(self):
+        self.task = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            await asyncio.sleep(0.05)
+
+    async def stop(self):
+        self.server.should_exit = True
+        await self.task
+
+
+def start_process(args, env, name):
+    log_file = open(os.path.join(env['BENCHMARK_WORK_DIR'], f'{name}.log'), 'w')
+    return subprocess.Popen(args, cwd=ROOT_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def stop_process(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def wait_ready(url, process, timeout=120):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"进程提前退出:{url}")
+            try:
+                response = await client.get(url)
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"等待服务启动超时:{url}")
+
+
+def build_app_env(args, stub_url, work_dir):
+    # 被测服务的环境变量：所有外部依赖指向本地模拟服务，环境变量优先于.env生效
+    env = dict(os.environ)
+    env.update({
+        'BENCHMARK_WORK_DIR': work_dir,
+        'API_SOURCE': 'openrouter',
+        'OPENROUTER_BASE_URL': f"{stub_url}/v1",
+        'OPENROUTER_API_KEY': 'benchmark',
+        'OPENROUTER_MODEL': 'benchmark-model',
+        'FIRECRAWL_API_URL': stub_url,
+        'FIRECRAWL_API_KEY': 'fc-benchmark',
+        'S3_ENDPOINT_URL': stub_url,
+        'S3_BUCKET_NAME': 'benchmark',
+        'S3_ACCESS_KEY_ID': 'benchmark',
+        'S3_SECRET_ACCESS_KEY': 'benchmark',
+        'S3_CUSTOM_DOMAIN': '',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AUTH_SECRET': '',
+        'TOKENIZER_TYPE': args.tokenizer,
+        'RESULT_CACHE_ENABLED': 'true' if args.cache else 'false',
+        'LLM_CACHE_ENABLED': 'true' if args.cache else 'false',
+        'RESULT_CACHE_DB_PATH': os.path.join(work_dir, 'result_cache.db'),
+        'LLM_CACHE_DB_PATH': os.path.join(work_dir, 'llm_cache.db'),
+        'JOB_DB_PATH': os.path.join(work_dir, 'jobs.db'),
+        'CALLBACK_DB_PATH': os.path.join(work_dir, 'callbacks.db'),
+        'JOB_WORKERS': str(args.job_workers),
+        'JOB_POLL_INTERVAL': '0.2',
+        'FETCH_HEDGE_ENABLED': 'true' if args.fetch == 'hedged' else 'false',
+    })
+    if args.workers > 1:
+        metrics_dir = os.path.join(work_dir, 'prometheus')
+        os.makedirs(metrics_dir, exist_ok=True)
+        env['PROMETHEUS_MULTIPROC_DIR'] = metrics_dir
+    return env
+
+
+class Benchmark:
+    def __init__(self, args, app_url, stub_url, receiver, sampler):
+        self.args = args
+        self.app_url = app_url
+        self.stub_url = stub_url
+        self.receiver = receiver
+        self.sampler = sampler
+        self.sites = args.sites.split(',')
+        self.client = httpx.AsyncClient(timeout=args.timeout,
+                                        limits=httpx.Limits(max_connections=None, max_keepalive_connections=None))
+        self.sequence = 0
+
+    def next_payload(self):
+        site = self.sites[self.sequence % len(self.sites)]
+        self.sequence += 1
+        return {
+            'url': f"{self.stub_url}/sites/{site}/",
+            'tags': self.args.tags.split(',') if self.args.tags else None,
+            'languages': self.args.languages.split(',') if self.args.languages else None,
+            'include_timings': True,
+        }, self.sequence
+
+    async def crawl_once(self):
+        payload, _ = self.next_payload()
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(f"{self.app_url}/site/crawl", json=payload)
+            body = response.json()
+            ok = response.status_code == 200 and body.get('code') == 200
+            return ok, time.perf_counter() - start, body.get('timings') or {}
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"请求失败:{e}")
+            return False, time.perf_counter() - start, {}
+
+    async def crawl_async_once(self):
+        payload, sequence = self.next_payload()
+        token = f"{os.getpid()}-{sequence}"
+        payload.update({'callback_url': self.receiver.url(token), 'key': 'benchmark'})
+        waiter = self.receiver.expect(token)
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(f"{self.app_url}/site/crawl_async", json=payload)
+            body = response.json()
+            if response.status_code != 200 or not (body.get('data') or {}).get('job_id'):
+                return False, time.perf_counter() - start, {}
+            arrived = await asyncio.wait_for(waiter, self.args.timeout)
+            # 回调body为爬取结果本身，失败时为null
+            result = self.receiver.results.get(token)
+            return bool(result) and result.get('url') == payload['url'], arrived - start, {}
+        except (httpx.HTTPError, ValueError, asyncio.TimeoutError) as e:
+            logger.warning(f"异步请求失败:{e}")
+            return False, time.perf_counter() - start, {}
+
+    async def run_level(self, mode, concurrency):
+        # 固定并发度的闭环压测：每个worker完成一个请求后立即发起下一个
+        once = self.crawl_once if mode == 'crawl' else self.crawl_async_once
+        total = self.args.requests
+        issued = 0
+        results = []
+
+        async def worker():
+            nonlocal issued
+            while issued < total:
+                issued += 1
+                results.append(await once())
+
+        self.sampler.start()
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        peak_rss = self.sampler.stop()
+
+        latencies = [latency for ok, latency, _ in results if ok]
+        stages = {}
+        for ok, _, timings in results:
+            for stage, seconds in timings.items():
+                stages.setdefault(stage, []).append(seconds)
+        return {
+            'mode': mode,
+            'concurrency': concurrency,
+            'requests': len(results),
+            'ok': len(latencies),
+            'errors': len(results) - len(latencies),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'max': max(latencies) if latencies else None,
+            'sites_per_min': round(len(latencies) / elapsed * 60, 2) if elapsed else 0,
+            'peak_rss_mb': peak_rss,
+            'stages': {stage: {'p50': percentile(values, 50), 'p95': percentile(values, 95)}
+                       for stage, values in sorted(stages.items())},
+        }
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def fmt(value):
+    return '-' if value is None else f"{value:.2f}"
+
+
+def print_report(report):
+    print()
+    print(f"{'mode':<7}{'conc':>5}{'ok':>6}{'err':>5}{'p50(s)':>9}{'p95(s)':>9}{'max(s)':>9}"
+          f"{'sites/min':>11}{'rss(MB)':>10}")
+    for level in report['levels']:
+        print(f"{level['mode']:<7}{level['concurrency']:>5}{level['ok']:>6}{level['errors']:>5}"
+              f"{fmt(level['p50']):>9}{fmt(level['p95']):>9}{fmt(level['max']):>9}"
+              f"{level['sites_per_min']:>11}{level['peak_rss_mb']:>10}")
+    for level in report['levels']:
+        if not level['stages']:
+            continue
+        print()
+        print(f"阶段耗时 mode={level['mode']} concurrency={level['concurrency']}")
+        for stage, values in level['stages'].items():
+            print(f"  {stage:<22}p50={fmt(values['p50']):>8}  p95={fmt(values['p95']):>8}")
+    print()
+    print(f"模拟服务调用统计: {report['stub_stats']}")
+
+
+async def run(args):
+    work_dir = tempfile.mkdtemp(prefix='crawler-benchmark-')
+    stub_port, app_port, callback_port = free_port(), free_port(), free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    env = build_app_env(args, stub_url, work_dir)
+
+    stub_args = [sys.executable, '-m', 'benchmark.stub_servers', '--port', str(stub_port),
+                 '--llm-ttft-ms', str(args.llm_ttft_ms), '--llm-tokens-per-second', str(args.llm_tokens_per_second),
+                 '--llm-completion-tokens', str(args.llm_completion_tokens),
+                 '--llm-error-rate', str(args.llm_error_rate),
+                 '--firecrawl-latency-scale', str(args.firecrawl_latency_scale)]
+    if args.fetch == 'browser':
+        stub_args.append('--firecrawl-fail-all')
+    app_args = [sys.executable, '-m', 'uvicorn', 'main_api:app', '--host', '127.0.0.1', '--port', str(app_port),
+                '--workers', str(args.workers), '--log-level', 'warning']
+
+    stub_process = start_process(stub_args, env, 'stub')
+    app_process = start_process(app_args, env, 'app')
+    receiver = CallbackReceiver(callback_port)
+    benchmark = None
+    try:
+        await wait_ready(f"{stub_url}/_stats", stub_process)
+        # 等待预热完成后再压测，避免冷启动耗时计入结果
+        await wait_ready(f"{app_url}/ready", app_process)
+        await receiver.start()
+        logger.info(f"服务已启动，日志目录:{work_dir}")
+
+        benchmark = Benchmark(args, app_url, stub_url, receiver, RSSSampler(app_process.pid))
+        levels = []
+        for mode in args.mode.split(','):
+            for concurrency in [int(value) for value in args.concurrency.split(',')]:
+                logger.info(f"压测 mode={mode} concurrency={concurrency} requests={args.requests}")
+                levels.append(await benchmark.run_level(mode, concurrency))
+
+        async with httpx.AsyncClient() as client:
+            stub_stats = (await client.get(f"{stub_url}/_stats")).json()
+        report = {'config': vars(args), 'levels': levels, 'stub_stats': stub_stats}
+        print_report(report)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            logger.info(f"压测结果已写入:{args.output}")
+    finally:
+        if benchmark:
+            await benchmark.close()
+        if receiver.task:
+            await receiver.stop()
+        stop_process(app_process)
+        stop_process(stub_process)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='离线压测爬虫服务，所有外部依赖使用本地模拟服务')
+    parser.add_argument('--mode', default='crawl', help='压测接口，逗号分隔：crawl,async')
+    parser.add_argument('--concurrency', default='1,4,8', help='并发度列表，逗号分隔')
+    parser.add_argument('--requests', type=int, default=24, help='每个并发度的请求数')
+    parser.add_argument('--sites', default='simple,landing,docs,slow,heavy,flaky', help='fixture站点，逗号分隔')
+    parser.add_argument('--tags', default='AI Image Generator,Productivity,Developer Tools,Writing')
+    parser.add_argument('--languages', default='English,简体中文,日本語', help='翻译语言，逗号分隔，为空不翻译')
+    parser.add_argument('--fetch', default='firecrawl', choices=['firecrawl', 'browser', 'hedged'],
+                        help='firecrawl：优先firecrawl失败降级浏览器；browser：firecrawl全部失败；hedged：对冲模式')
+    parser.add_argument('--cache', action='store_true', help='开启结果缓存与LLM缓存')
+    parser.add_argument('--tokenizer', default='estimate', help='TOKENIZER_TYPE，默认按字符估算避免下载模型')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker数')
+    parser.add_argument('--job-workers', type=int, default=4, help='异步任务worker数')
+    parser.add_argument('--timeout', type=float, default=300, help='单个请求超时（秒）')
+    parser.add_argument('--llm-ttft-ms', type=float, default=400)
+    parser.add_argument('--llm-tokens-per-second', type=float, default=120)
+    parser.add_argument('--llm-completion-tokens', type=int, default=400)
+    parser.add_argument('--llm-error-rate', type=float, default=0)
+    parser.add_argument('--firecrawl-latency-scale', type=float, default=1.0)
+    parser.add_argument('--output', help='压测结果JSON输出路径')
+    return parser
+
+
+if __name__ == '__main__':
+    asyncio.run(run(build_parser().parse_args()))
@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from io import BytesIO
+from urllib.parse import urlparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from PIL import Image, ImageDraw
+
+from util.extract_util import ExtractUtil
+
+# 设置日志
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(filename)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_sites():
+    # 读取fixture站点清单，按name索引；heavy类站点将<!-- repeat -->块重复多次生成大页面
+    with open(os.path.join(FIXTURE_DIR, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    sites = {}
+    for site in manifest['sites']:
+        with open(os.path.join(FIXTURE_DIR, site['file']), encoding='utf-8') as f:
+            html = f.read()
+        repeat = site.get('repeat', 0)
+        if repeat and '<!-- repeat -->' in html:
+            head, rest = html.split('<!-- repeat -->', 1)
+            block, tail = rest.split('<!-- /repeat -->', 1)
+            html = head + ''.join(block.replace('{index}', str(i)) for i in range(repeat)) + tail
+        sites[site['name']] = dict(site, html=html)
+    return sites
+
+
+def render_screenshot(name, width, height):
+    # 生成确定性的伪截图：色块+文字行，压缩率与真实页面截图接近
+    rand = random.Random(name)
+    image = Image.new('RGB', (width, height), (250, 250, 252))
+    draw = ImageDraw.Draw(image)
+    y = 0
+    while y < height:
+        block_height = rand.randint(60, 320)
+        color = tuple(rand.randint(120, 255) for _ in range(3))
+        draw.rectangle([0, y, width, y + block_height], fill=color)
+        for line in range(y + 20, y + block_height - 10, 24):
+            draw.rectangle([80, line, 80 + rand.randint(200, width - 160), line + 10], fill=(40, 40, 60))
+        y += block_height + rand.randint(10, 60)
+    output = BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def decode_aws_chunked(body):
+    # 解析aws-chunked编码的上传数据：<hex长度>[;chunk-signature=...]\r\n<数据>\r\n ... 0\r\n[trailer]
+    data = bytearray()
+    position = 0
+    while position < len(body):
+        line_end = body.index(b'\r\n', position)
+        size = int(body[position:line_end].split(b';')[0], 16)
+        if size == 0:
+            break
+        start = line_end + 2
+        data += body[start:start + size]
+        position = start + size + 2
+    return bytes(data)
+
+
+class StubState:
+    def __init__(self, args):
+        self.sites = load_sites()
+        self.extract_util = ExtractUtil()
+        self.screenshots = {}
+        self.objects = {}
+        self.uploads = {}
+        self.llm_ttft = args.llm_ttft_ms / 1000
+        self.llm_tokens_per_second = args.llm_tokens_per_second
+        self.llm_completion_tokens = args.llm_completion_tokens
+        self.llm_error_rate = args.llm_error_rate
+        self.firecrawl_scale = args.firecrawl_latency_scale
+        self.firecrawl_fail_all = args.firecrawl_fail_all
+        self.stats = {'pages': 0, 'firecrawl': 0, 'llm': 0, 'llm_tokens': 0, 's3_put': 0, 's3_bytes': 0}
+
+    def get_screenshot(self, name):
+        if name not in self.screenshots:
+            width, height = self.sites[name].get('screenshot', [1920, 1080])
+            self.screenshots[name] = render_screenshot(name, width, height)
+        return self.screenshots[name]
+
+
+def site_name_from_url(url):
+    # fixture站点url格式：http://host:port/sites/<name>/
+    parts = urlparse(url).path.strip('/').split('/')
+    return parts[1] if len(parts) >= 2 and parts[0] == 'sites' else None
+
+
+def completion_text(tokens):
+    # 按token数生成markdown文本，估算约4个字符一个token
+    words = ['AI', 'tool', 'helps', 'teams', 'write', 'faster', 'with', 'smart', 'summaries', 'and', 'search']
+    lines = ['### What is it?']
+    line = []
+    for i in range(max(tokens - 4, 1)):
+        line.append(words[i % len(words)])
+        if len(line) >= 16:
+            lines.append(' '.join(line) + '.')
+            line = []
+    if line:
+        lines.append(' '.join(line) + '.')
+    return '\n'.join(lines)
+
+
+def create_app(args):
+    app = FastAPI()
+    state = StubState(args)
+    app.state.stub = state
+
+    # ---------- fixture站点 ----------
+    @app.api_route('/sites/{name}/', methods=['GET', 'HEAD'])
+    async def site_page(name: str, request: Request):
+        site = state.sites.get(name)
+        if site is None:
+            return Response(status_code=404)
+        etag = '"' + hashlib.md5(site['html'].encode()).hexdigest() + '"'
+        if request.method == 'HEAD':
+            # 增量爬取的预检请求
+            status_code = 304 if request.headers.get('if-none-match') == etag else 200
+            return Response(status_code=status_code, headers={'ETag': etag})
+        state.stats['pages'] += 1
+        await asyncio.sleep(site.get('page_delay_ms', 0) / 1000)
+        return HTMLResponse(site['html'], headers={'ETag': etag})
+
+    @app.get('/screenshots/{name}.png')
+    async def site_screenshot(name: str):
+        if name not in state.sites:
+            return Response(status_code=404)
+        return Response(state.get_screenshot(name), media_type='image/png')
+
+    @app.get('/assets/{file_name}')
+    async def site_asset(file_name: str, ms: int = 0):
+        # 模拟慢速的第三方资源
+        await asyncio.sleep(ms / 1000)
+        if file_name.endswith('.png'):
+            return Response(render_screenshot(file_name, 32, 18), media_type='image/png')
+        if file_name.endswith('.css'):
+            return Response('body{font-family:sans-serif}', media_type='text/css')
+        return Response('window.__loaded = (window.__loaded || 0) + 1;', media_type='application/javascript')
+
+    # ---------- firecrawl ----------
+    async def firecrawl_scrape(request: Request):
+        body = await request.json()
+        url = body.get('url', '')
+        name = site_name_from_url(url)
+        site = state.sites.get(name)
+        state.stats['firecrawl'] += 1
+        if site is None:
+            return JSONResponse({'success': False, 'error': 'unknown fixture'}, status_code=404)
+        await asyncio.sleep(site.get('firecrawl_delay_ms', 1000) / 1000 * state.firecrawl_scale)
+        if state.firecrawl_fail_all or site.get('firecrawl_fail'):
+            return JSONResponse({'success': False, 'error': 'Failed to scrape'}, status_code=500)
+
+        extracted = state.extract_util.extract(site['html'])
+        base = str(request.base_url).rstrip('/')
+        return {
+            'success': True,
+            'data': {
+                'markdown': extracted['content'],
+                'metadata': {'title': extracted['title'], 'description': extracted['description'],
+                             'sourceURL': url, 'statusCode': 200},
+                'actions': {'screenshots': [f"{base}/screenshots/{name}.png"]},
+            }
+        }
+
+    app.post('/v1/scrape')(firecrawl_scrape)
+    app.post('/v2/scrape')(firecrawl_scrape)
+
+    # ---------- OpenAI兼容LLM ----------
+    async def chat_completions(request: Request):
+        body = await request.json()
+        state.stats['llm'] += 1
+        if state.llm_error_rate and random.random() < state.llm_error_rate:
+            return JSONResponse({'error': {'message': 'Rate limit reached', 'type': 'rate_limit'}}, status_code=429,
+                                headers={'retry-after': '1'})
+
+        prompt_tokens = sum(len(str(message.get('content', ''))) for message in body.get('messages', [])) // 4
+        json_mode = (body.get('response_format') or {}).get('type') == 'json_object'
+        system_prompt = next((str(message.get('content', '')) for message in body.get('messages', [])
+                              if message.get('role') == 'system'), '')
+        completion_tokens = state.llm_completion_tokens
+        if json_mode and '"detail"' in system_prompt:
+            # detail+tags单次调用
+            content = json.dumps({'detail': completion_text(completion_tokens), 'tags': []})
+        elif json_mode:
+            content, completion_tokens = '{}', 2
+        else:
+            content = completion_text(completion_tokens)
+        state.stats['llm_tokens'] += prompt_tokens + completion_tokens
+        completion_id = 'chatcmpl-' + uuid.uuid4().hex
+        created = int(time.time())
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                 'total_tokens': prompt_tokens + completion_tokens}
+        headers = {'x-ratelimit-limit-requests': '10000', 'x-ratelimit-remaining-requests': '9999',
+                   'x-ratelimit-limit-tokens': '10000000', 'x-ratelimit-remaining-tokens': '9999999'}
+        token_delay = 1 / state.llm_tokens_per_second if state.llm_tokens_per_second else 0
+
+        if body.get('stream'):
+            async def stream():
+                await asyncio.sleep(state.llm_ttft)
+                pieces = content.split(' ')
+                for index, piece in enumerate(pieces):
+                    chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                             'model': body.get('model'),
+                             'choices': [{'index': 0, 'delta': {'content': piece if index == 0 else ' ' + piece},
+                                          'finish_reason': None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(token_delay * completion_tokens / len(pieces))
+                done = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                        'model': body.get('model'), 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                        'usage': usage}
+                yield f"data: {json.dumps(done)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(stream(), media_type='text/event-stream', headers=headers)
+
+        await asyncio.sleep(state.llm_ttft + token_delay * completion_tokens)
+        return JSONResponse({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': usage,
+        }, headers=headers)
+
+    app.post('/v1/chat/completions')(chat_completions)
+    # groq客户端的接口路径
+    app.post('/openai/v1/chat/completions')(chat_completions)
+
+    # 模拟服务调用统计，需在S3通配路由之前注册
+    @app.get('/_stats')
+    async def stub_stats():
+        return dict(state.stats, objects=len(state.objects))
+
+    # ---------- S3（path-style） ----------
+    async def read_object_body(request):
+        body = await request.body()
+        if 'aws-chunked' in request.headers.get('content-encoding', '') or \
+                request.headers.get('x-amz-content-sha256', '').startswith('STREAMING-'):
+            body = decode_aws_chunked(body)
+        return body
+
+    @app.put('/{bucket}/{key:path}')
+    async def s3_put(bucket: str, key: str, request: Request):
+        body = await read_object_body(request)
+        upload_id = request.query_params.get('uploadId')
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if upload_id:
+            state.uploads.setdefault(upload_id, {})[int(request.query_params['partNumber'])] = body
+        else:
+            state.objects[(bucket, key)] = body
+            state.stats['s3_put'] += 1
+            state.stats['s3_bytes'] += len(body)
+        return Response(headers={'ETag': etag})
+
+    @app.post('/{bucket}/{key:path}')
+    async def s3_multipart(bucket: str, key: str, request: Request):
+        if 'uploads' in request.query_params:
+            upload_id = uuid.uuid4().hex
+            state.uploads[upload_id] = {}
+            xml = (f'<?xml version="1.0" encoding="UTF-8"?><InitiateMultipartUploadResult>'
+                   f'<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>'
+                   f'</InitiateMultipartUploadResult>')
+            return Response(xml, media_type='application/xml')
+        parts = state.uploads.pop(request.query_params.get('uploadId'), {})
+        body = b''.join(parts[number] for number in sorted(parts))
+        state.objects[(bucket, key)] = body
+        state.stats['s3_put'] += 1
+        state.stats['s3_bytes'] += len(body)
+        xml = (f'<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult>'
+               f'<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>"{hashlib.md5(body).hexdigest()}"</ETag>'
+               f'</CompleteMultipartUploadResult>')
+        return Response(xml, media_type='application/xml')
+
+    @app.api_route('/{bucket}/{key:path}', methods=['GET', 'HEAD'])
+    async def s3_get(bucket: str, key: str, request: Request):
+        body = state.objects.get((bucket, key))
+        if body is None:
+            return Response(status_code=404)
+        headers = {'ETag': '"' + hashlib.md5(body).hexdigest() + '"', 'Content-Length': str(len(body))}
+        if request.method == 'HEAD':
+            return Response(headers=headers)
+        return Response(body, headers=headers)
+
+    return app
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='本地模拟服务：fixture站点、firecrawl、OpenAI兼容LLM、S3')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--llm-ttft-ms', type=float, default=400, help='LLM首token延迟（毫秒）')
+    parser.add_argument('--llm-tokens-per-second', type=float, default=120, help='LLM输出速率，0表示不限速')
+    parser.add_argument('--llm-completion-tokens', type=int, default=400, help='每次LLM返回的token数')
+    parser.add_argument('--llm-error-rate', type=float, default=0, help='LLM返回429的概率')
+    parser.add_argument('--firecrawl-latency-scale', type=float, default=1.0, help='firecrawl延迟缩放系数')
+    parser.add_argument('--firecrawl-fail-all', action='store_true', help='firecrawl全部失败，强制走浏览器')
+    return parser
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    args = build_parser().parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level='warning')
@@ -0,0 +1,56 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from util.browser_util import BrowserFleet
+from util.env_util import load_env
+from util.log_util import get_logger
+from util.metrics_util import MetricsUtil
+
+logger = get_logger(__name__)
+
+load_env()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await fleet.start()
+    yield
+    await fleet.close()
+    MetricsUtil.mark_process_dead()
+
+
+# 浏览器管理进程：统一启动、检查、重启Chromium，所有uvicorn worker通过租约共享这组浏览器
+# 启动方式：uvicorn browser_manager:app --host 127.0.0.1 --port 8041 --workers 1（必须单进程）
+app = FastAPI(lifespan=lifespan)
+fleet = BrowserFleet()
+
+
+@app.post('/browser/lease')
+async def lease():
+    try:
+        data = await fleet.acquire()
+    except asyncio.TimeoutError:
+        logger.warning("申请共享浏览器超时")
+        return {'code': 10001, 'msg': 'timeout', 'data': None}
+    return {'code': 200, 'msg': 'success', 'data': data}
+
+
+@app.post('/browser/lease/{lease_id}/release')
+async def release(lease_id: str):
+    released = await fleet.release(lease_id)
+    return {'code': 200 if released else 10001, 'msg': 'success' if released else 'fail', 'data': None}
+
+
+@app.get('/browser/status')
+async def status():
+    return {'code': 200, 'msg': 'success', 'data': fleet.status()}
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv('BROWSER_MANAGER_HOST', '127.0.0.1'),
+                port=int(os.getenv('BROWSER_MANAGER_PORT', 8041)))
@@ -1,36 +1,84 @@
-import logging
+import asyncio
+import json
 import os
+import time
+from contextlib import asynccontextmanager
 from typing import List, Optional
 
-import requests
-from dotenv import load_dotenv
-from fastapi import FastAPI, Header, BackgroundTasks, HTTPException
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
-from website_crawler import WebsitCrawler
+from util.cache_util import ResultCache
+from util.callback_util import CallbackDispatcher
+from util.env_util import load_env
+from util.executor_util import ExecutorUtil
+from util.http_util import HttpUtil
+from util.job_util import JobQueue, JobWorkerPool
+from util.log_util import get_logger
+from util.metrics_util import MetricsUtil
+from util.scheduler_util import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, AdmissionRejected, CrawlScheduler
+from util.warmup_util import WarmupUtil
+from website_crawler import WebsitCrawler, llm
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    # 启动后台任务worker，后台预热各组件（不阻塞启动，预热进度见/ready）
+    callback_dispatcher.start()
+    job_worker_pool.start()
+    warmup.start()
+    yield
+    # 停止预热与任务worker，关闭浏览器，释放共享的HTTP连接池和线程池
+    await warmup.close()
+    await job_worker_pool.stop()
+    await callback_dispatcher.close()
+    await website_crawler.browser_pool.close()
+    await HttpUtil.close()
+    ExecutorUtil.shutdown()
+    MetricsUtil.mark_process_dead()
+
+
+app = FastAPI(lifespan=lifespan)
 website_crawler = WebsitCrawler()
-load_dotenv()
+result_cache = ResultCache()
+# 准入控制：全局/单域名并发上限，交互请求优先于后台任务
+scheduler = CrawlScheduler()
+load_env()
 system_auth_secret = os.getenv('AUTH_SECRET')
+# 批量爬取的默认并发数、最大并发数和单次最大条数
+batch_concurrency = int(os.getenv('BATCH_CONCURRENCY', 4))
+batch_max_concurrency = int(os.getenv('BATCH_MAX_CONCURRENCY', 16))
+batch_max_items = int(os.getenv('BATCH_MAX_ITEMS', 500))
 
-# 设置日志记录
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(filename)s - %(funcName)s - %(lineno)d - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 
 class URLRequest(BaseModel):
     url: str
     tags: Optional[List[str]] = None
     languages: Optional[List[str]] = None
+    no_cache: Optional[bool] = False  # 不读也不写结果缓存
+    refresh_cache: Optional[bool] = False  # 不读缓存，重新处理后写入缓存
+    include_timings: Optional[bool] = False  # 响应中返回各阶段耗时明细
+    incremental: Optional[bool] = False  # 增量爬取：页面内容/外观未变化的部分复用上次的结果，响应中返回reused
 
 
 class AsyncURLRequest(URLRequest):
     callback_url: str
     key: str
+    idempotency_key: Optional[str] = None  # 幂等key，重复提交返回已有任务
+    callback_batch: Optional[bool] = False  # 是否允许与同一callback_url的其他结果合并为一次批量回调（body为{job_id, url, result}数组）
+
+
+class StreamURLRequest(URLRequest):
+    stream_format: Optional[str] = 'ndjson'  # ndjson 或 sse
+
+
+class BatchURLRequest(BaseModel):
+    items: List[URLRequest]
+    concurrency: Optional[int] = None  # 并发数，默认BATCH_CONCURRENCY
+    stream_format: Optional[str] = 'ndjson'  # ndjson 或 sse
 
 
 @app.get('/test/hello')
@@ -38,6 +86,15 @@ def hello():
     return 'hello'
 
 
+@app.get('/ready')
+async def ready():
+    # 就绪检查：预热全部完成（成功或失败）后返回200，否则返回503
+    data = warmup.snapshot()
+    if not data['ready']:
+        return JSONResponse(status_code=503, content={'code': 503, 'msg': 'warming up', 'data': data})
+    return {'code': 200, 'msg': 'success', 'data': data}
+
+
 @app.post('/site/crawl')
 async def scrape(request: URLRequest, authorization: Optional[str] = Header(None)):
     url = request.url
@@ -48,13 +105,15 @@ async def scrape(request: URLRequest, authorization: Optional[str] = Header(None
         # 配置了非空的auth_secret，才验证
         validate_authorization(authorization)
 
-    # result = await website_crawler.scrape_website(url.strip(), tags, languages)
-    # 用firecrawl爬
-    result = await website_crawler.scrape_website_by_firecrawl(url.strip(), tags, languages)
-
-    if result is None:
-        # 将原本的当降级处理
-        result = await website_crawler.scrape_website(url.strip(), tags, languages)
+    start_time = time.time()
+    timings = MetricsUtil.start_request()
+    try:
+        result = await crawl_site(url.strip(), tags, languages, request.no_cache, request.refresh_cache,
+                                  incremental=request.incremental)
+    except AdmissionRejected as e:
+        # 排队已满或等待超时，快速拒绝
+        MetricsUtil.record_request('/site/crawl', 429, time.time() - start_time)
+        return too_many_requests(e.retry_after)
 
     # 若result为None,则 code="10001"，msg="处理异常，请稍后重试"
     code = 200
@@ -62,6 +121,7 @@ async def scrape(request: URLRequest, authorization: Optional[str] = Header(None
     if result is None:
         code = 10001
         msg = 'fail'
+    MetricsUtil.record_request('/site/crawl', code, time.time() - start_time)
 
     # 将数据映射到 'data' 键下
     response = {
@@ -69,12 +129,15 @@ async def scrape(request: URLRequest, authorization: Optional[str] = Header(None
         'msg': msg,
         'data': result
     }
+    if request.include_timings:
+        timings['total'] = round(time.time() - start_time, 4)
+        response['timings'] = timings
     return response
 
 
 @app.post('/site/crawl_async')
-async def scrape_async(background_tasks: BackgroundTasks, request: AsyncURLRequest,
-                       authorization: Optional[str] = Header(None)):
+async def scrape_async(request: AsyncURLRequest, authorization: Optional[str] = Header(None),
+                       idempotency_key: Optional[str] = Header(None)):
     url = request.url
     callback_url = request.callback_url
     key = request.key  # 请求回调接口，放header Authorization: 'Bear key'
@@ -85,19 +148,260 @@ async def scrape_async(background_tasks: BackgroundTasks, request: AsyncURLReque
         # 配置了非空的auth_secret，才验证
         validate_authorization(authorization)
 
-    # 直接发起异步请求:使用background_tasks后台运行
-    background_tasks.add_task(async_worker, url.strip(), tags, languages, callback_url, key)
+    # 写入持久化任务队列，由后台worker池处理；幂等key可以放在请求体或Idempotency-Key header中
+    payload = {'url': url.strip(), 'tags': tags, 'languages': languages, 'callback_url': callback_url, 'key': key,
+               'callback_batch': request.callback_batch, 'incremental': request.incremental}
+    job, created = await ExecutorUtil.run(job_queue.enqueue, payload, request.idempotency_key or idempotency_key)
+    if not created:
+        logger.info(f"幂等key已存在，返回已有任务:{job['id']}")
 
-    # 若result为None,则 code="10001"，msg="处理异常，请稍后重试"
     code = 200
     msg = 'success'
     response = {
         'code': code,
-        'msg': msg
+        'msg': msg,
+        'data': {'job_id': job['id'], 'status': job['status']}
     }
     return response
 
 
+@app.get('/site/jobs/{job_id}')
+async def get_job(job_id: str, authorization: Optional[str] = Header(None)):
+    if system_auth_secret:
+        validate_authorization(authorization)
+    job = await ExecutorUtil.run(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # 不返回回调key
+    job['payload'].pop('key', None)
+    return {'code': 200, 'msg': 'success', 'data': job}
+
+
+@app.get('/site/jobs/{job_id}/result')
+async def get_job_result(job_id: str, authorization: Optional[str] = Header(None)):
+    if system_auth_secret:
+        validate_authorization(authorization)
+    job = await ExecutorUtil.run(job_queue.get, job_id, True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    code = 200
+    msg = job['status']
+    if job['status'] == 'failed':
+        code = 10001
+        msg = 'fail'
+    return {'code': code, 'msg': msg, 'data': job['result']}
+
+
+@app.post('/site/crawl_stream')
+async def scrape_stream(request: StreamURLRequest, authorization: Optional[str] = Header(None)):
+    # 流式爬取：各阶段完成后立即推送事件，最后推送与/site/crawl相同的完整结果
+    if system_auth_secret:
+        # 配置了非空的auth_secret，才验证
+        validate_authorization(authorization)
+
+    if scheduler.is_full():
+        return too_many_requests(scheduler.retry_after())
+
+    sse = request.stream_format == 'sse'
+    media_type = 'text/event-stream' if sse else 'application/x-ndjson'
+    return StreamingResponse(stream_crawl(request, sse), media_type=media_type)
+
+
+async def stream_crawl(request, sse=False):
+    # 事件依次为 page、screenshot、detail_delta（detail流式文本）、detail、tags、language（每个语言一条），最后为result
+    queue = asyncio.Queue()
+
+    async def emit(event, data):
+        await queue.put({'type': event, 'data': data})
+
+    async def crawl():
+        start_time = time.time()
+        timings = MetricsUtil.start_request()
+        retry_after = None
+        try:
+            result = await crawl_site(request.url.strip(), request.tags, request.languages, request.no_cache,
+                                      request.refresh_cache, emit, request.incremental)
+        except AdmissionRejected as e:
+            result = None
+            retry_after = e.retry_after
+        except Exception as e:
+            logger.error(f"流式处理{request.url}异常: {e}")
+            result = None
+        code, msg = (200, 'success') if result is not None else (10001, 'fail')
+        if retry_after is not None:
+            code, msg = 429, 'too many requests'
+        MetricsUtil.record_request('/site/crawl_stream', code, time.time() - start_time)
+        record = {'type': 'result', 'code': code, 'msg': msg, 'data': result}
+        if retry_after is not None:
+            record['retry_after'] = retry_after
+        if request.include_timings:
+            timings['total'] = round(time.time() - start_time, 4)
+            record['timings'] = timings
+        await queue.put(record)
+
+    task = asyncio.create_task(crawl())
+    try:
+        while True:
+            record = await queue.get()
+            yield format_stream_record(record, sse)
+            if record['type'] == 'result':
+                break
+    finally:
+        # 客户端断开时取消未完成的任务
+        task.cancel()
+
+
+def format_stream_record(record, sse=False):
+    line = json.dumps(record, ensure_ascii=False)
+    return f"data: {line}\n\n" if sse else line + "\n"
+
+
+@app.post('/site/crawl_batch')
+async def scrape_batch(request: BatchURLRequest, authorization: Optional[str] = Header(None)):
+    if system_auth_secret:
+        # 配置了非空的auth_secret，才验证
+        validate_authorization(authorization)
+
+    if not request.items:
+        raise HTTPException(status_code=400, detail="items is empty")
+    if len(request.items) > batch_max_items:
+        raise HTTPException(status_code=400, detail=f"items exceeds {batch_max_items}")
+
+    concurrency = max(1, min(request.concurrency or batch_concurrency, batch_max_concurrency))
+    if request.stream_format == 'sse':
+        return StreamingResponse(stream_batch(request.items, concurrency, sse=True), media_type='text/event-stream')
+    return StreamingResponse(stream_batch(request.items, concurrency), media_type='application/x-ndjson')
+
+
+async def stream_batch(items, concurrency, sse=False):
+    # 按完成顺序逐条输出结果，最后输出汇总
+    start_time = time.time()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def crawl_item(index, item):
+        async with semaphore:
+            item_start = time.time()
+            timings = MetricsUtil.start_request()
+            try:
+                # 批量爬取按后台优先级排队，不会被拒绝
+                result = await crawl_site(item.url.strip(), item.tags, item.languages, item.no_cache,
+                                          item.refresh_cache, incremental=item.incremental,
+                                          priority=PRIORITY_BACKGROUND)
+            except Exception as e:
+                logger.error(f"批量处理{item.url}异常: {e}")
+                result = None
+            MetricsUtil.record_request('/site/crawl_batch', 200 if result is not None else 10001,
+                                       time.time() - item_start)
+            timings['total'] = round(time.time() - item_start, 4)
+        return index, item, result, timings
+
+    tasks = [asyncio.create_task(crawl_item(index, item)) for index, item in enumerate(items)]
+    success = 0
+    try:
+        for future in asyncio.as_completed(tasks):
+            index, item, result, timings = await future
+            if result is None:
+                code, msg = 10001, 'fail'
+            else:
+                code, msg = 200, 'success'
+                success += 1
+            record = {'type': 'result', 'index': index, 'url': item.url, 'code': code, 'msg': msg, 'data': result}
+            if item.include_timings:
+                record['timings'] = timings
+            yield format_stream_record(record, sse)
+        yield format_stream_record({'type': 'summary', 'code': 200, 'msg': 'success', 'data': {
+            'total': len(items),
+            'success': success,
+            'fail': len(items) - success,
+            'seconds': round(time.time() - start_time, 2),
+        }}, sse)
+    finally:
+        # 客户端断开时取消未完成的任务
+        for task in tasks:
+            task.cancel()
+
+
+@app.get('/site/callbacks/dead_letters')
+async def list_dead_letters(authorization: Optional[str] = Header(None)):
+    if system_auth_secret:
+        validate_authorization(authorization)
+    letters = await ExecutorUtil.run(callback_dispatcher.dead_letters.list)
+    return {'code': 200, 'msg': 'success', 'data': letters}
+
+
+@app.post('/site/callbacks/dead_letters/replay')
+async def replay_dead_letters(letter_id: Optional[int] = None, authorization: Optional[str] = Header(None)):
+    # 不传letter_id时重放所有死信（单次最多100条）
+    if system_auth_secret:
+        validate_authorization(authorization)
+    count = await callback_dispatcher.replay(letter_id)
+    return {'code': 200, 'msg': 'success', 'data': {'replayed': count}}
+
+
+@app.get('/metrics')
+async def metrics():
+    # Prometheus指标，抓取时更新任务队列深度
+    try:
+        MetricsUtil.set_job_queue_depth(await ExecutorUtil.run(job_queue.count_by_status))
+    except Exception as e:
+        logger.warning(f"读取任务队列深度异常: {e}")
+    content, content_type = MetricsUtil.generate()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get('/site/cache/stats')
+async def cache_stats(authorization: Optional[str] = Header(None)):
+    if system_auth_secret:
+        validate_authorization(authorization)
+    return {
+        'code': 200,
+        'msg': 'success',
+        'data': {
+            'result_cache': result_cache.stats(),
+            'llm_cache': llm.completion_cache.stats(),
+            'llm_providers': llm.providers.stats(),
+            'fetch_stats': website_crawler.fetch_stats.snapshot(),
+            'scheduler': scheduler.stats(),
+        }
+    }
+
+
+async def crawl_site(url, tags, languages, no_cache=False, refresh_cache=False, emit=None, incremental=False,
+                     priority=PRIORITY_INTERACTIVE):
+    # 结果缓存：key为规范化url + tags + languages；emit不为空时推送各阶段事件（流式接口使用）
+    # 增量爬取按站点指纹复用结果，不读写结果缓存
+    # 未命中缓存时由调度器控制并发，交互请求排队已满时抛出AdmissionRejected
+    use_cache = result_cache.enabled and not no_cache and not incremental
+    cache_key = result_cache.build_key(url, tags, languages) if use_cache else None
+    if use_cache and not refresh_cache:
+        result = await result_cache.get(cache_key)
+        if result is not None:
+            logger.info(f"命中结果缓存:{url}")
+            return result
+
+    async with scheduler.slot(url, priority):
+        if website_crawler.hedge_enabled:
+            # 对冲模式：firecrawl超时未返回时并行启动浏览器爬取
+            result = await website_crawler.scrape_website_hedged(url, tags, languages, emit, incremental)
+        else:
+            # result = await website_crawler.scrape_website(url, tags, languages)
+            # 用firecrawl爬
+            result = await website_crawler.scrape_website_by_firecrawl(url, tags, languages, emit, incremental)
+
+            if result is None:
+                # 将原本的当降级处理
+                result = await website_crawler.scrape_website(url, tags, languages, emit, incremental)
+
+    if use_cache and result is not None:
+        await result_cache.set_result(cache_key, result)
+    return result
+
+
+def too_many_requests(retry_after):
+    return JSONResponse(status_code=429, headers={'Retry-After': str(retry_after)},
+                        content={'code': 429, 'msg': 'too many requests', 'data': {'retry_after': retry_after}})
+
+
 def validate_authorization(authorization):
     if not authorization:
         raise HTTPException(status_code=400, detail="Missing Authorization header")
@@ -105,19 +409,53 @@ def validate_authorization(authorization):
         raise HTTPException(status_code=401, detail="Authorization is error")
 
 
-async def async_worker(url, tags, languages, callback_url, key):
-    # 爬虫处理封装为一个异步任务
-    result = await website_crawler.scrape_website(url.strip(), tags, languages)
-    # 通过requests post 请求调用call_back_url， 携带参数result， heaer 为key
-    try:
-        logger.info(f'callback begin:{callback_url}')
-        response = requests.post(callback_url, json=result, headers={'Authorization': 'Bearer ' + key})
-        if response.status_code != 200:
-            logger.error(f'callback error:{callback_url}', response.text)
-        else:
-            logger.info(f'callback success:{callback_url}')
-    except Exception as e:
-        logger.error(f'call_back exception:{callback_url}', e)
+async def async_worker(job):
+    # 处理队列中的爬虫任务，失败且未超过最大次数时抛出异常，由队列延迟重试
+    payload = job['payload']
+    callback_url = payload['callback_url']
+    key = payload['key']
+    start_time = time.time()
+    # 后台任务优先级低于交互请求，名额不足时一直排队等待
+    async with scheduler.slot(payload['url'], PRIORITY_BACKGROUND):
+        result = await website_crawler.scrape_website(payload['url'], payload['tags'], payload['languages'],
+                                                      incremental=payload.get('incremental'))
+    MetricsUtil.record_request('/site/crawl_async', 200 if result is not None else 10001, time.time() - start_time)
+    if result is None and job['attempts'] < job['max_attempts']:
+        raise RuntimeError(f"处理{payload['url']}失败，等待重试")
+
+    # 通过回调投递器异步调用call_back_url， 携带参数result， heaer 为key；失败自动重试，最终失败写入死信
+    # 回调先写入outbox再返回，随后任务才标记为完成，重启不会丢失回调
+    await callback_dispatcher.dispatch(callback_url, key, result, batch=payload.get('callback_batch'),
+                                       job_id=job['id'], url=payload['url'])
+    return result
+
+
+async def async_failed(job):
+    # 任务最终失败（处理异常或worker崩溃/卡死导致租约过期且次数用完），回调通知结果为空
+    payload = job['payload']
+    MetricsUtil.record_request('/site/crawl_async', 10001, 0)
+    await callback_dispatcher.dispatch(payload['callback_url'], payload['key'], None,
+                                       batch=payload.get('callback_batch'), job_id=job['id'], url=payload['url'])
+
+
+callback_dispatcher = CallbackDispatcher()
+job_queue = JobQueue()
+job_worker_pool = JobWorkerPool(job_queue, async_worker, async_failed)
+
+
+async def warm_up_http():
+    # LLM后端与常用地址的连接池
+    urls = [url.strip() for url in os.getenv('WARMUP_URLS', '').split(',') if url.strip()]
+    if website_crawler.browser_pool.manager_url:
+        urls.append(f"{website_crawler.browser_pool.manager_url}/browser/status")
+    await asyncio.gather(llm.providers.warm_up(), HttpUtil.warm_up(urls))
+
+
+warmup = WarmupUtil()
+warmup.register('clients', lambda: ExecutorUtil.run(website_crawler.create_clients))
+warmup.register('tokenizer', lambda: ExecutorUtil.run(llm.token_util.warm_up))
+warmup.register('http', warm_up_http)
+warmup.register('browser', website_crawler.browser_pool.warm_up)
 
 
 if __name__ == '__main__':
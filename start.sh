@@ -0,0 +1,47 @@
+#!/bin/bash
+# 容器启动脚本：启动浏览器管理进程与api服务并监控，任一进程退出时停止另一个并以非0状态退出，由容器重启策略拉起
+set -u
+
+# 多进程指标目录，每次启动前清空上次遗留的指标文件
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+    rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+    mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+fi
+
+signaled=0
+manager_pid=
+api_pid=
+
+stop() {
+    kill -TERM ${api_pid} ${manager_pid} 2>/dev/null
+}
+trap 'signaled=1; stop' TERM INT
+
+uvicorn browser_manager:app --host 127.0.0.1 --port 8041 --workers 1 &
+manager_pid=$!
+
+# 等待浏览器管理进程可用后再启动api服务
+for i in $(seq 1 60); do
+    if python -c "import urllib.request; urllib.request.urlopen('${BROWSER_MANAGER_URL}/browser/status', timeout=2)" 2>/dev/null; then
+        break
+    fi
+    if ! kill -0 ${manager_pid} 2>/dev/null; then
+        echo "浏览器管理进程启动失败" >&2
+        exit 1
+    fi
+    sleep 1
+done
+
+uvicorn main_api:app --host 0.0.0.0 --port 8040 --workers "${API_WORKERS:-4}" &
+api_pid=$!
+
+# 任一进程退出（或收到停止信号）后停止另一个，等待全部退出
+wait -n ${api_pid} ${manager_pid}
+status=$?
+stop
+wait
+if [ ${signaled} -eq 1 ]; then
+    exit 0
+fi
+echo "进程意外退出(${status})，已停止所有服务" >&2
+exit $(( status == 0 ? 1 : status ))
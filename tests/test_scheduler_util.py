@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+
+from util.scheduler_util import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, AdmissionRejected, CrawlScheduler
+
+
+def create_scheduler(max_concurrency=1, max_per_domain=1, max_queue=2):
+    scheduler = CrawlScheduler()
+    scheduler.enabled = True
+    scheduler.max_concurrency = max_concurrency
+    scheduler.max_per_domain = max_per_domain
+    scheduler.max_queue = max_queue
+    scheduler.queue_timeout = 5
+    return scheduler
+
+
+class CrawlSchedulerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_background_waiters_do_not_reject_interactive(self):
+        scheduler = create_scheduler()
+        await scheduler.acquire('busy.com', PRIORITY_INTERACTIVE)
+        # 后台任务排队数超过SCHEDULER_MAX_QUEUE
+        background = [asyncio.create_task(scheduler.acquire(f'site{index}.com', PRIORITY_BACKGROUND))
+                      for index in range(5)]
+        await asyncio.sleep(0)
+        self.assertEqual(len(scheduler.waiting), 5)
+        self.assertFalse(scheduler.is_full())
+
+        interactive = asyncio.create_task(scheduler.acquire('user.com', PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        self.assertFalse(interactive.done())
+
+        # 名额释放后交互请求先于排在前面的后台任务执行
+        scheduler.release('busy.com')
+        await interactive
+        self.assertEqual(scheduler.domains, {'user.com': 1})
+        self.assertTrue(all(not task.done() for task in background))
+
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        self.assertEqual(scheduler.waiting, [])
+
+    async def test_interactive_queue_limit(self):
+        scheduler = create_scheduler()
+        await scheduler.acquire('busy.com', PRIORITY_INTERACTIVE)
+        waiters = [asyncio.create_task(scheduler.acquire(f'site{index}.com', PRIORITY_INTERACTIVE))
+                   for index in range(2)]
+        await asyncio.sleep(0)
+        self.assertTrue(scheduler.is_full())
+        with self.assertRaises(AdmissionRejected):
+            await scheduler.acquire('user.com', PRIORITY_INTERACTIVE)
+
+        for task in waiters:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        self.assertEqual(scheduler.interactive_waiting, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
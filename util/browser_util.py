@@ -0,0 +1,494 @@
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+import psutil
+
+from util.env_util import load_env
+from util.http_util import HttpUtil
+from util.log_util import get_logger
+from util.metrics_util import BROWSER_LAUNCHES, BROWSER_PAGES_IN_USE, BROWSER_PAGES_WAITING
+
+logger = get_logger(__name__)
+
+# 默认拦截的统计/广告/追踪域名
+DEFAULT_BLOCK_DOMAINS = ','.join([
+    'google-analytics.com', 'googletagmanager.com', 'googlesyndication.com', 'doubleclick.net',
+    'googleadservices.com', 'facebook.net', 'connect.facebook.net', 'hotjar.com', 'clarity.ms', 'segment.com',
+    'segment.io', 'mixpanel.com', 'amplitude.com', 'fullstory.com', 'intercom.io', 'intercomcdn.com',
+    'crisp.chat', 'hs-scripts.com', 'hs-analytics.net', 'hubspot.com', 'adservice.google.com', 'bat.bing.com',
+    'ads-twitter.com', 'static.ads-twitter.com', 'linkedin.com/px', 'snap.licdn.com', 'tiktok.com/i18n/pixel',
+    'sentry.io', 'newrelic.com', 'nr-data.net', 'cdn.heapanalytics.com', 'plausible.io', 'umami.is',
+])
+
+# DOM稳定判断：页面加载完成，或元素数量在stableMs内不再变化
+DOM_STABLE_FUNCTION = '''(stableMs) => {
+    const now = Date.now();
+    const size = document.getElementsByTagName('*').length;
+    const state = window.__crawlerDomState || (window.__crawlerDomState = {size: -1, since: now});
+    if (size !== state.size) {
+        state.size = size;
+        state.since = now;
+    }
+    return document.readyState === 'complete' || now - state.since >= stableMs;
+}'''
+
+# 等待两帧，确保视口已经绘制
+VIEWPORT_PAINTED_FUNCTION = '() => new Promise(resolve => requestAnimationFrame(() => requestAnimationFrame(resolve)))'
+
+
+def split_config_list(value):
+    return [item.strip().lower() for item in value.split(',') if item.strip()] if value else []
+
+
+def get_site(host):
+    # 粗略取主域名（最后两段），用于判断第三方请求
+    parts = host.split('.')
+    return '.'.join(parts[-2:]) if len(parts) >= 2 else host
+
+
+def match_domain(url, host, domains):
+    # 域名规则支持子域名匹配，包含/的规则按url前缀匹配（如 linkedin.com/px）
+    for domain in domains:
+        if '/' in domain:
+            if domain in url:
+                return True
+        elif host == domain or host.endswith('.' + domain):
+            return True
+    return False
+
+
+class PageLoader:
+    """
+    页面加载策略：
+    - 请求拦截：按资源类型、域名黑名单、第三方脚本拦截，白名单域名始终放行
+    - 分级等待：domcontentloaded -> DOM稳定或页面加载完成 -> 视口绘制完成，总时长不超过硬上限
+    """
+
+    def __init__(self):
+        load_env()
+        self.block_enabled = os.getenv('BLOCK_RESOURCES', 'true').lower() == 'true'
+        self.block_resource_types = set(split_config_list(os.getenv('BLOCK_RESOURCE_TYPES', 'font,media')))
+        self.block_domains = split_config_list(os.getenv('BLOCK_DOMAINS', DEFAULT_BLOCK_DOMAINS))
+        self.allow_domains = split_config_list(os.getenv('ALLOW_DOMAINS', ''))
+        self.block_third_party_scripts = os.getenv('BLOCK_THIRD_PARTY_SCRIPTS', 'false').lower() == 'true'
+        self.hard_timeout = float(os.getenv('PAGE_LOAD_HARD_TIMEOUT', 30))
+        self.dom_stable_ms = int(os.getenv('PAGE_DOM_STABLE_MS', 800))
+
+    def should_block(self, request, site):
+        url = request.url.lower()
+        host = urlparse(url).hostname or ''
+        if match_domain(url, host, self.allow_domains):
+            return False
+        if request.resourceType in self.block_resource_types:
+            return True
+        if match_domain(url, host, self.block_domains):
+            return True
+        if self.block_third_party_scripts and request.resourceType == 'script' and get_site(host) != site:
+            return True
+        return False
+
+    async def handle_request(self, request, site):
+        try:
+            if self.should_block(request, site):
+                await request.abort()
+            else:
+                await request.continue_()
+        except Exception as e:
+            logger.debug(f"请求拦截处理异常: {e}")
+
+    async def setup_interception(self, page, url):
+        if not self.block_enabled:
+            return
+        site = get_site(urlparse(url).hostname or '')
+        await page.setRequestInterception(True)
+        page.on('request', lambda request: asyncio.ensure_future(self.handle_request(request, site)))
+
+    async def load(self, page, url):
+        start = time.monotonic()
+        await self.setup_interception(page, url)
+        try:
+            await page.goto(url, {'timeout': int(self.hard_timeout * 1000), 'waitUntil': 'domcontentloaded'})
+        except Exception as e:
+            logger.info(f'页面加载超时,不影响继续执行后续流程:{e}')
+
+        remaining = self.hard_timeout - (time.monotonic() - start)
+        if remaining > 0:
+            try:
+                await page.waitForFunction(DOM_STABLE_FUNCTION, {'polling': 100, 'timeout': int(remaining * 1000)},
+                                           self.dom_stable_ms)
+            except Exception as e:
+                logger.info(f'等待DOM稳定超时,不影响继续执行后续流程:{e}')
+
+        try:
+            await asyncio.wait_for(page.evaluate(VIEWPORT_PAINTED_FUNCTION), timeout=2)
+        except Exception as e:
+            logger.info(f'等待视口绘制超时,不影响继续执行后续流程:{e}')
+        logger.info(f"页面加载用时: {time.monotonic() - start:.2f} 秒")
+
+
+class BrowserPool:
+    """
+    浏览器页面池：
+    - 信号量限制同时打开的页面数，超出的请求排队等待
+    - 每次租用创建独立的无痕上下文，释放时无论成功失败都会关闭
+    - 租用前做健康检查，Chromium崩溃后自动重启
+    - 浏览器累计服务页面数或内存占用超过阈值后主动回收，旧浏览器在最后一个页面释放后关闭
+    - 配置BROWSER_MANAGER_URL时从浏览器管理进程租用共享浏览器，配置BROWSER_WS_ENDPOINT时直接连接已有浏览器，
+      多个uvicorn worker共用一组浏览器，由管理进程统一控制并发和内存
+    """
+
+    def __init__(self):
+        load_env()
+        self.size = int(os.getenv('BROWSER_POOL_SIZE', 4))
+        self.acquire_timeout = float(os.getenv('BROWSER_ACQUIRE_TIMEOUT', 120))
+        self.max_pages = int(os.getenv('BROWSER_MAX_PAGES', 200))
+        self.max_rss_mb = int(os.getenv('BROWSER_MAX_RSS_MB', 2048))
+        self.browser = None
+        self.pages_served = 0
+        # 每个浏览器实例上正在使用的页面数
+        self.active = {}
+        # 共享浏览器：管理进程地址或DevTools websocket地址，都未配置时在本进程启动浏览器
+        self.manager_url = os.getenv('BROWSER_MANAGER_URL', '').rstrip('/')
+        self.ws_endpoint = os.getenv('BROWSER_WS_ENDPOINT', '')
+        # 已连接的共享浏览器：browser_id → (ws地址, 浏览器)
+        self.remote = {}
+        self.semaphore = asyncio.Semaphore(self.size)
+        self.lock = asyncio.Lock()
+        logger.info(f"浏览器页面池大小: {self.size}")
+        if self.manager_url:
+            logger.info(f"使用浏览器管理进程: {self.manager_url}")
+        elif self.ws_endpoint:
+            logger.info(f"连接共享浏览器: {self.ws_endpoint}")
+
+    @staticmethod
+    async def launch_browser():
+        # pyppeteer导入较慢，第一次启动浏览器时才导入
+        from pyppeteer import launch
+        return await launch(headless=True,
+                            ignoreDefaultArgs=["--enable-automation"],
+                            ignoreHTTPSErrors=True,
+                            args=['--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu',
+                                  '--disable-software-rasterizer', '--disable-setuid-sandbox'],
+                            handleSIGINT=False, handleSIGTERM=False, handleSIGHUP=False)
+
+    @staticmethod
+    async def is_healthy(browser):
+        process = getattr(browser, 'process', None)
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            await asyncio.wait_for(browser.version(), timeout=5)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def get_rss_mb(browser):
+        # 统计Chromium主进程及其子进程的常驻内存
+        process = getattr(browser, 'process', None)
+        if process is None:
+            return 0
+        try:
+            root = psutil.Process(process.pid)
+            processes = [root] + root.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / 1024 / 1024
+        except psutil.Error:
+            return 0
+
+    @staticmethod
+    async def close_browser(browser):
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.warning(f"关闭浏览器异常: {e}")
+
+    def should_recycle(self, browser):
+        if self.pages_served >= self.max_pages:
+            logger.info(f"浏览器已服务{self.pages_served}个页面，进行回收")
+            return True
+        rss_mb = self.get_rss_mb(browser)
+        if rss_mb >= self.max_rss_mb:
+            logger.info(f"浏览器内存占用{int(rss_mb)}MB，进行回收")
+            return True
+        return False
+
+    async def get_browser(self):
+        # 加锁，避免并发请求同时启动多个浏览器
+        async with self.lock:
+            browser = self.browser
+            if browser is not None and (not await self.is_healthy(browser) or self.should_recycle(browser)):
+                self.browser = None
+                # 没有页面在使用时立即关闭，否则等最后一个页面释放后关闭
+                if not self.active.get(browser):
+                    self.active.pop(browser, None)
+                    await self.close_browser(browser)
+            if self.browser is None:
+                logger.info("正在启动浏览器")
+                self.browser = await self.launch_browser()
+                BROWSER_LAUNCHES.inc()
+                self.pages_served = 0
+            self.pages_served += 1
+            self.active[self.browser] = self.active.get(self.browser, 0) + 1
+            return self.browser
+
+    async def release_browser(self, browser):
+        async with self.lock:
+            self.active[browser] = self.active.get(browser, 1) - 1
+            if browser is not self.browser and self.active[browser] <= 0:
+                self.active.pop(browser, None)
+                await self.close_browser(browser)
+
+    @staticmethod
+    async def disconnect_browser(browser):
+        try:
+            await browser.disconnect()
+        except Exception as e:
+            logger.warning(f"断开共享浏览器连接异常: {e}")
+
+    async def connect_browser(self, browser_id, endpoint):
+        # 复用到共享浏览器的连接；管理进程重启浏览器后ws地址变化，或连接失效时重新连接
+        async with self.lock:
+            current = self.remote.get(browser_id)
+            if current is not None and (current[0] != endpoint or not await self.is_healthy(current[1])):
+                self.remote.pop(browser_id, None)
+                await self.disconnect_browser(current[1])
+                current = None
+            if current is None:
+                from pyppeteer import connect
+                logger.info(f"正在连接共享浏览器: {endpoint}")
+                current = (endpoint, await connect(browserWSEndpoint=endpoint, ignoreHTTPSErrors=True))
+                self.remote[browser_id] = current
+            return current[1]
+
+    async def acquire_lease(self):
+        # 向管理进程申请页面租约，管理进程的全局并发达到上限时排队等待
+        response = await HttpUtil.get_client().post(f"{self.manager_url}/browser/lease",
+                                                    timeout=self.acquire_timeout + 10)
+        response.raise_for_status()
+        body = response.json()
+        if body.get('code') != 200:
+            raise RuntimeError(f"申请共享浏览器失败: {body.get('msg')}")
+        return body['data']
+
+    async def release_lease(self, lease):
+        try:
+            await HttpUtil.get_client().post(f"{self.manager_url}/browser/lease/{lease['lease_id']}/release")
+        except Exception as e:
+            # 释放失败时由管理进程在租约到期后回收
+            logger.warning(f"释放共享浏览器租约异常: {e}")
+
+    async def acquire(self):
+        # 返回(浏览器, 租约)，本进程启动的浏览器和直连的共享浏览器没有租约
+        if self.manager_url:
+            lease = await self.acquire_lease()
+            try:
+                return await self.connect_browser(lease['browser_id'], lease['ws_endpoint']), lease
+            except BaseException:
+                await self.release_lease(lease)
+                raise
+        if self.ws_endpoint:
+            return await self.connect_browser('default', self.ws_endpoint), None
+        return await self.get_browser(), None
+
+    async def release(self, browser, lease):
+        if lease is not None:
+            await self.release_lease(lease)
+        elif not self.ws_endpoint:
+            await self.release_browser(browser)
+
+    @asynccontextmanager
+    async def page(self):
+        BROWSER_PAGES_WAITING.inc()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.acquire_timeout)
+        finally:
+            BROWSER_PAGES_WAITING.dec()
+        BROWSER_PAGES_IN_USE.inc()
+        try:
+            browser, lease = await self.acquire()
+            try:
+                context = await browser.createIncognitoBrowserContext()
+                try:
+                    yield await context.newPage()
+                finally:
+                    try:
+                        await context.close()
+                    except Exception as e:
+                        logger.warning(f"关闭浏览器上下文异常: {e}")
+            finally:
+                await self.release(browser, lease)
+        finally:
+            BROWSER_PAGES_IN_USE.dec()
+            self.semaphore.release()
+
+    async def warm_up(self):
+        # 预先启动（或连接）浏览器，并打开一次页面，避免第一个请求承担浏览器启动耗时
+        async with self.page():
+            pass
+
+    async def close(self):
+        async with self.lock:
+            browsers = list(self.active.keys())
+            if self.browser is not None and self.browser not in browsers:
+                browsers.append(self.browser)
+            self.browser = None
+            self.active.clear()
+            remote = [browser for _, browser in self.remote.values()]
+            self.remote.clear()
+        for browser in browsers:
+            await self.close_browser(browser)
+        # 共享浏览器只断开连接，由管理进程负责关闭
+        for browser in remote:
+            await self.disconnect_browser(browser)
+
+
+class BrowserFleet:
+    """
+    浏览器管理进程使用的共享浏览器组：
+    - 启动固定数量的Chromium，定时健康检查，崩溃后自动重启
+    - 以租约方式分配浏览器，全局信号量限制所有worker同时打开的页面数
+    - 浏览器累计服务页面数或内存超过阈值后不再分配新租约，租约全部释放后重启
+    - 租约超时未释放（worker崩溃）时自动回收
+    """
+
+    def __init__(self):
+        load_env()
+        self.size = int(os.getenv('BROWSER_FLEET_SIZE', 2))
+        self.max_concurrency = int(os.getenv('BROWSER_FLEET_MAX_PAGES', 8))
+        self.lease_seconds = float(os.getenv('BROWSER_LEASE_SECONDS', 300))
+        self.acquire_timeout = float(os.getenv('BROWSER_ACQUIRE_TIMEOUT', 120))
+        self.health_interval = float(os.getenv('BROWSER_HEALTH_INTERVAL', 10))
+        self.max_pages = int(os.getenv('BROWSER_MAX_PAGES', 200))
+        self.max_rss_mb = int(os.getenv('BROWSER_MAX_RSS_MB', 2048))
+        # 每个浏览器的状态：browser/ws地址/当前租约数/累计服务页面数/是否待回收
+        self.slots = []
+        self.leases = {}
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.lock = asyncio.Lock()
+        self.monitor_task = None
+        logger.info(f"共享浏览器数量: {self.size}, 全局最大页面数: {self.max_concurrency}")
+
+    async def launch_slot(self, slot):
+        slot['browser'] = await BrowserPool.launch_browser()
+        BROWSER_LAUNCHES.inc()
+        slot.update(endpoint=slot['browser'].wsEndpoint, served=0, draining=False, launched_at=time.time())
+        logger.info(f"浏览器{slot['id']}已启动: {slot['endpoint']}")
+
+    async def restart_slot(self, slot):
+        browser = slot.get('browser')
+        slot['browser'] = None
+        if browser is not None:
+            await BrowserPool.close_browser(browser)
+        try:
+            await self.launch_slot(slot)
+        except Exception as e:
+            logger.error(f"浏览器{slot['id']}启动失败，等待下次健康检查重试: {e}")
+
+    async def start(self):
+        for index in range(self.size):
+            slot = {'id': f"browser-{index}", 'browser': None, 'endpoint': None, 'active': 0, 'served': 0,
+                    'draining': False}
+            self.slots.append(slot)
+            await self.restart_slot(slot)
+        self.monitor_task = asyncio.create_task(self.monitor())
+
+    def pick_slot(self):
+        # 选择可用且租约最少的浏览器
+        candidates = [slot for slot in self.slots if slot['browser'] is not None and not slot['draining']]
+        return min(candidates, key=lambda slot: slot['active']) if candidates else None
+
+    async def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        await asyncio.wait_for(self.semaphore.acquire(), timeout=self.acquire_timeout)
+        try:
+            while True:
+                async with self.lock:
+                    slot = self.pick_slot()
+                    if slot is not None:
+                        slot['active'] += 1
+                        slot['served'] += 1
+                        if slot['served'] >= self.max_pages:
+                            logger.info(f"浏览器{slot['id']}已服务{slot['served']}个页面，等待回收")
+                            slot['draining'] = True
+                        lease_id = uuid.uuid4().hex
+                        self.leases[lease_id] = {'slot': slot, 'expires_at': time.monotonic() + self.lease_seconds}
+                        return {'lease_id': lease_id, 'browser_id': slot['id'], 'ws_endpoint': slot['endpoint'],
+                                'lease_seconds': self.lease_seconds}
+                # 所有浏览器都在重启中，稍后重试
+                if time.monotonic() >= deadline:
+                    raise asyncio.TimeoutError()
+                await asyncio.sleep(0.5)
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    async def release(self, lease_id):
+        async with self.lock:
+            lease = self.leases.pop(lease_id, None)
+            if lease is None:
+                return False
+            lease['slot']['active'] -= 1
+        self.semaphore.release()
+        return True
+
+    async def check(self):
+        now = time.monotonic()
+        for lease_id in [lease_id for lease_id, lease in self.leases.items() if lease['expires_at'] <= now]:
+            logger.warning(f"租约{lease_id}超时未释放，自动回收")
+            await self.release(lease_id)
+
+        for slot in self.slots:
+            browser = slot['browser']
+            if browser is None:
+                await self.restart_slot(slot)
+                continue
+            if not await BrowserPool.is_healthy(browser):
+                logger.warning(f"浏览器{slot['id']}健康检查失败，正在重启")
+                await self.restart_slot(slot)
+                continue
+            rss_mb = BrowserPool.get_rss_mb(browser)
+            if not slot['draining'] and rss_mb >= self.max_rss_mb:
+                logger.info(f"浏览器{slot['id']}内存占用{int(rss_mb)}MB，等待回收")
+                slot['draining'] = True
+            if slot['draining'] and slot['active'] <= 0:
+                logger.info(f"回收浏览器{slot['id']}")
+                await self.restart_slot(slot)
+
+    async def monitor(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"浏览器健康检查异常: {e}")
+
+    def status(self):
+        return {
+            'max_concurrency': self.max_concurrency,
+            'leases': len(self.leases),
+            'browsers': [{
+                'id': slot['id'],
+                'endpoint': slot['endpoint'],
+                'alive': slot['browser'] is not None,
+                'active': slot['active'],
+                'served': slot['served'],
+                'draining': slot['draining'],
+                'rss_mb': round(BrowserPool.get_rss_mb(slot['browser']), 1) if slot['browser'] else 0,
+            } for slot in self.slots],
+        }
+
+    async def close(self):
+        if self.monitor_task is not None:
+            self.monitor_task.cancel()
+            try:
+                await self.monitor_task
+            except asyncio.CancelledError:
+                pass
+        for slot in self.slots:
+            if slot['browser'] is not None:
+                await BrowserPool.close_browser(slot['browser'])
+                slot['browser'] = None
@@ -0,0 +1,222 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from util.common_util import CommonUtil
+from util.env_util import load_env
+from util.executor_util import ExecutorUtil
+from util.log_util import get_logger
+from util.metrics_util import MetricsUtil
+
+logger = get_logger(__name__)
+
+
+class LRUCache:
+    """
+    进程内LRU缓存，支持TTL与容量上限，线程安全
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            expire_at, value = item
+            if expire_at and expire_at < time.time():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return copy.deepcopy(value)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            expire_at = time.time() + ttl if ttl else 0
+            self.data[key] = (expire_at, copy.deepcopy(value))
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SQLiteCache:
+    """
+    基于SQLite的持久化缓存，多个uvicorn worker可共享同一个数据库文件，值以JSON存储
+    """
+
+    def __init__(self, db_path, table, ttl, max_size=0):
+        self.db_path = db_path
+        self.table = table
+        self.ttl = ttl
+        self.max_size = max_size
+        self.writes = 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} '
+                         f'(key TEXT PRIMARY KEY, value TEXT NOT NULL, expire_at REAL NOT NULL, '
+                         f'accessed_at REAL NOT NULL)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.table}_accessed_at ON {self.table} (accessed_at)')
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, key):
+        now = time.time()
+        with self.connect() as conn:
+            row = conn.execute(f'SELECT value, expire_at FROM {self.table} WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] and row[1] < now:
+                conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+                return None
+            conn.execute(f'UPDATE {self.table} SET accessed_at = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expire_at = now + ttl if ttl else 0
+        with self.connect() as conn:
+            conn.execute(f'INSERT OR REPLACE INTO {self.table} (key, value, expire_at, accessed_at) '
+                         f'VALUES (?, ?, ?, ?)', (key, json.dumps(value, ensure_ascii=False), expire_at, now))
+            self.writes += 1
+            # 定期清理过期数据，并按最近访问时间淘汰超出容量的数据
+            if self.writes % 100 == 0:
+                conn.execute(f'DELETE FROM {self.table} WHERE expire_at > 0 AND expire_at < ?', (now,))
+                if self.max_size:
+                    conn.execute(f'DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} '
+                                 f'ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)', (self.max_size,))
+
+    def delete(self, key):
+        with self.connect() as conn:
+            conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+
+
+class TieredCache:
+    """
+    两级缓存：进程内LRU + 可选的SQLite持久化层，记录命中/未命中次数
+    """
+
+    def __init__(self, name, max_size, ttl, db_path=None, db_max_size=0):
+        self.name = name
+        self.memory = LRUCache(max_size, ttl)
+        self.persistent = SQLiteCache(db_path, name, ttl, db_max_size) if db_path else None
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+
+    async def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            try:
+                value = await ExecutorUtil.run(self.persistent.get, key)
+            except Exception as e:
+                logger.warning(f"读取{self.name}持久化缓存异常: {e}")
+            if value is not None:
+                self.persistent_hits += 1
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        MetricsUtil.record_cache(self.name, value is not None)
+        return value
+
+    async def set(self, key, value, ttl=None):
+        # ttl为空时使用缓存默认有效期
+        self.memory.set(key, value, ttl)
+        if self.persistent is not None:
+            try:
+                await ExecutorUtil.run(self.persistent.set, key, value, ttl)
+            except Exception as e:
+                logger.warning(f"写入{self.name}持久化缓存异常: {e}")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'persistent_hits': self.persistent_hits,
+            'hit_rate': round(self.hits / total, 4) if total else 0,
+            'memory_size': len(self.memory),
+        }
+
+
+class ResultCache(TieredCache):
+    """
+    /site/crawl 结果缓存，key为规范化url + tags + languages；
+    降级的结果（detail/多语言缺失、截图上传失败）只缓存较短时间，避免在整个有效期内返回不完整的结果
+    """
+
+    def __init__(self):
+        load_env()
+        self.enabled = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+        # 不完整结果的有效期（秒），0表示不缓存
+        self.partial_ttl = int(os.getenv('RESULT_CACHE_PARTIAL_TTL', 60))
+        super().__init__('result_cache',
+                         max_size=int(os.getenv('RESULT_CACHE_MAX_ITEMS', 1000)),
+                         ttl=int(os.getenv('RESULT_CACHE_TTL', 3600)),
+                         db_path=os.getenv('RESULT_CACHE_DB_PATH') or None)
+
+    @staticmethod
+    def build_key(url, tags, languages):
+        raw = json.dumps({
+            'url': CommonUtil.normalize_url(url),
+            'tags': sorted(tags) if tags else [],
+            'languages': languages or [],
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_complete(result):
+        if not result.get('detail') or not result.get('screenshot_data'):
+            return False
+        return all(entry.get(field) for entry in result.get('languages') or []
+                   for field in ('title', 'description', 'detail') if result.get(field))
+
+    async def set_result(self, key, result):
+        if self.is_complete(result):
+            await self.set(key, result)
+        elif self.partial_ttl > 0:
+            logger.info(f"结果不完整，缓存{self.partial_ttl}秒: {result.get('url')}")
+            await self.set(key, result, self.partial_ttl)
+
+
+class CompletionCache(TieredCache):
+    """
+    LLM结果缓存，key为模型、系统提示词、temperature、截取后的用户输入等参数的哈希
+    """
+
+    def __init__(self):
+        load_env()
+        self.enabled = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+        super().__init__('llm_cache',
+                         max_size=int(os.getenv('LLM_CACHE_MAX_ITEMS', 2000)),
+                         ttl=int(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600)),
+                         db_path=os.getenv('LLM_CACHE_DB_PATH') or None,
+                         db_max_size=int(os.getenv('LLM_CACHE_DB_MAX_ITEMS', 100000)))
+
+    @staticmethod
+    def build_key(*params):
+        raw = json.dumps(params, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
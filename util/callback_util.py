@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+import uuid
+from urllib.parse import urlparse
+
+import httpx
+
+from util.env_util import load_env
+from util.executor_util import ExecutorUtil
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+
+class DeadLetterStore:
+    """
+    回调投递失败的死信存储（SQLite），支持查询与重放
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS callback_dead_letters ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, callback_url TEXT NOT NULL, key TEXT NOT NULL, '
+                         'body TEXT NOT NULL, error TEXT, attempts INTEGER NOT NULL, created_at REAL NOT NULL)')
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def add(self, callback_url, key, body, error, attempts):
+        with self.connect() as conn:
+            conn.execute('INSERT INTO callback_dead_letters (callback_url, key, body, error, attempts, created_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (callback_url, key, json.dumps(body, ensure_ascii=False), error, attempts, time.time()))
+
+    def list(self, limit=100):
+        with self.connect() as conn:
+            rows = conn.execute('SELECT id, callback_url, error, attempts, created_at FROM callback_dead_letters '
+                                'ORDER BY id LIMIT ?', (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def pop(self, letter_id=None, limit=100):
+        # 取出并删除死信，重放失败时会重新写入
+        with self.connect() as conn:
+            if letter_id is None:
+                rows = conn.execute('SELECT * FROM callback_dead_letters ORDER BY id LIMIT ?', (limit,)).fetchall()
+            else:
+                rows = conn.execute('SELECT * FROM callback_dead_letters WHERE id = ?', (letter_id,)).fetchall()
+            conn.executemany('DELETE FROM callback_dead_letters WHERE id = ?', [(row['id'],) for row in rows])
+        return [{'callback_url': row['callback_url'], 'key': row['key'], 'body': json.loads(row['body'])}
+                for row in rows]
+
+    def count(self):
+        with self.connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM callback_dead_letters').fetchone()[0]
+
+
+class CallbackOutbox:
+    """
+    待投递回调的持久化存储（SQLite），与死信存在同一个库：
+    - dispatch先写入outbox再返回，投递成功后删除，最终失败时在同一事务中转入死信
+    - 每条记录带租约，进程崩溃或重启后租约过期，由任一进程重新领取投递（至少一次）
+    """
+
+    def __init__(self, db_path, lease_seconds):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        with self.connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS callback_outbox ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, callback_url TEXT NOT NULL, key TEXT NOT NULL, '
+                         'body TEXT NOT NULL, batch INTEGER NOT NULL, owner TEXT, claim_token TEXT, '
+                         'lease_until REAL NOT NULL, created_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_callback_outbox_lease ON callback_outbox (lease_until)')
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def add(self, callback_url, key, body, batch, owner):
+        now = time.time()
+        with self.connect() as conn:
+            cursor = conn.execute('INSERT INTO callback_outbox (callback_url, key, body, batch, owner, lease_until, '
+                                  'created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                  (callback_url, key, json.dumps(body, ensure_ascii=False), int(bool(batch)), owner,
+                                   now + self.lease_seconds, now))
+        return cursor.lastrowid
+
+    def remove(self, row_ids):
+        with self.connect() as conn:
+            conn.executemany('DELETE FROM callback_outbox WHERE id = ?', [(row_id,) for row_id in row_ids])
+
+    def dead_letter(self, row_ids, callback_url, key, body, error, attempts):
+        # 写入死信并删除outbox记录，同一事务
+        with self.connect() as conn:
+            conn.execute('INSERT INTO callback_dead_letters (callback_url, key, body, error, attempts, created_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (callback_url, key, json.dumps(body, ensure_ascii=False), error, attempts, time.time()))
+            conn.executemany('DELETE FROM callback_outbox WHERE id = ?', [(row_id,) for row_id in row_ids])
+
+    def claim_expired(self, owner, limit=100):
+        # 领取租约已过期的记录（原进程已退出），单条UPDATE语句保证多个进程不会重复领取
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self.connect() as conn:
+            conn.execute('UPDATE callback_outbox SET owner = ?, claim_token = ?, lease_until = ? WHERE id IN '
+                         '(SELECT id FROM callback_outbox WHERE lease_until < ? ORDER BY id LIMIT ?)',
+                         (owner, token, now + self.lease_seconds, now, limit))
+            rows = conn.execute('SELECT * FROM callback_outbox WHERE claim_token = ? ORDER BY id',
+                                (token,)).fetchall()
+        return [{'id': row['id'], 'callback_url': row['callback_url'], 'key': row['key'],
+                 'body': json.loads(row['body']), 'batch': bool(row['batch'])} for row in rows]
+
+    def release(self, owner):
+        # 进程退出时释放未投递完成的记录，其他进程可以立即领取
+        with self.connect() as conn:
+            cursor = conn.execute('UPDATE callback_outbox SET lease_until = 0 WHERE owner = ?', (owner,))
+        return cursor.rowcount
+
+    def count(self):
+        with self.connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM callback_outbox').fetchone()[0]
+
+
+class CallbackDispatcher:
+    """
+    异步回调投递：
+    - 独立的连接池，按host限制并发连接，设置超时
+    - 失败按指数退避+随机抖动重试，最终失败写入死信存储，可重放
+    - 支持将同一回调地址的多个结果合并为一次批量回调，每一项为 {job_id, url, result}
+    - dispatch写入outbox后返回，投递在后台进行，不阻塞任务worker；重启后未投递的回调由恢复协程重新投递
+    """
+
+    def __init__(self):
+        load_env()
+        self.timeout = float(os.getenv('CALLBACK_TIMEOUT', 10))
+        self.max_retries = int(os.getenv('CALLBACK_MAX_RETRIES', 5))
+        self.backoff_base = float(os.getenv('CALLBACK_BACKOFF_BASE', 1))
+        self.backoff_max = float(os.getenv('CALLBACK_BACKOFF_MAX', 60))
+        self.max_per_host = int(os.getenv('CALLBACK_MAX_PER_HOST', 10))
+        self.batch_size = int(os.getenv('CALLBACK_BATCH_SIZE', 20))
+        self.batch_interval = float(os.getenv('CALLBACK_BATCH_INTERVAL', 5))
+        db_path = os.getenv('CALLBACK_DB_PATH', './data/callbacks.db')
+        self.dead_letters = DeadLetterStore(db_path)
+        # outbox租约需覆盖一条回调所有重试的最长耗时
+        self.outbox = CallbackOutbox(db_path, float(os.getenv('CALLBACK_LEASE_SECONDS', 900)))
+        self.recover_interval = float(os.getenv('CALLBACK_RECOVER_INTERVAL', 30))
+        self.owner = uuid.uuid4().hex
+        self.recover_task = None
+        self.client = None
+        self.host_semaphores = {}
+        self.pending = set()
+        # 批量回调缓冲区：(callback_url, key) -> [(outbox id, item), ...]
+        self.batches = {}
+        self.batch_timers = {}
+
+    def get_client(self):
+        if self.client is None or self.client.is_closed:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.max_per_host * 10),
+            )
+        return self.client
+
+    def get_host_semaphore(self, callback_url):
+        host = urlparse(callback_url).netloc
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self.host_semaphores[host]
+
+    def get_backoff(self, attempt):
+        # 指数退避 + 全抖动
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        return task
+
+    def start(self):
+        # 启动恢复协程，投递其他进程遗留（租约已过期）的回调
+        if self.recover_task is None:
+            self.recover_task = asyncio.create_task(self.run_recover())
+
+    async def run_recover(self):
+        while True:
+            try:
+                rows = await ExecutorUtil.run(self.outbox.claim_expired, self.owner)
+                if rows:
+                    logger.info(f"恢复未投递的回调: {len(rows)}条")
+                for row in rows:
+                    self.enqueue(row['id'], row['callback_url'], row['key'], row['body'], row['batch'])
+            except Exception as e:
+                logger.error(f"恢复未投递的回调异常: {e}")
+            await asyncio.sleep(self.recover_interval)
+
+    async def dispatch(self, callback_url, key, result, batch=False, job_id=None, url=None):
+        # 先持久化到outbox再返回，调用方随后标记任务完成也不会丢失回调
+        body = {'job_id': job_id, 'url': url, 'result': result} if batch else result
+        row_id = await ExecutorUtil.run(self.outbox.add, callback_url, key, body, batch, self.owner)
+        self.enqueue(row_id, callback_url, key, body, batch)
+
+    def enqueue(self, row_id, callback_url, key, body, batch):
+        if not batch:
+            self.spawn(self.deliver(callback_url, key, body, [row_id]))
+            return
+        buffer_key = (callback_url, key)
+        self.batches.setdefault(buffer_key, []).append((row_id, body))
+        if len(self.batches[buffer_key]) >= self.batch_size:
+            self.flush(buffer_key)
+        elif buffer_key not in self.batch_timers:
+            self.batch_timers[buffer_key] = self.spawn(self.flush_later(buffer_key))
+
+    async def flush_later(self, buffer_key):
+        await asyncio.sleep(self.batch_interval)
+        self.batch_timers.pop(buffer_key, None)
+        self.flush(buffer_key)
+
+    def flush(self, buffer_key):
+        timer = self.batch_timers.pop(buffer_key, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        items = self.batches.pop(buffer_key, None)
+        if items:
+            callback_url, key = buffer_key
+            self.spawn(self.deliver(callback_url, key, [body for _, body in items], [row_id for row_id, _ in items]))
+
+    async def deliver(self, callback_url, key, body, row_ids):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self.get_backoff(attempt - 1))
+            try:
+                logger.info(f'callback begin:{callback_url}, 第{attempt + 1}次')
+                async with self.get_host_semaphore(callback_url):
+                    response = await self.get_client().post(callback_url, json=body,
+                                                            headers={'Authorization': 'Bearer ' + key})
+                if response.status_code == 200:
+                    logger.info(f'callback success:{callback_url}')
+                    try:
+                        await ExecutorUtil.run(self.outbox.remove, row_ids)
+                    except Exception as e:
+                        # 删除失败时租约过期后会再投递一次
+                        logger.error(f'删除已投递的回调异常:{callback_url}, {e}')
+                    return True
+                error = f'status {response.status_code}: {response.text[:200]}'
+                # 4xx（除408/429外）重试无意义
+                if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                    break
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+            logger.warning(f'callback error:{callback_url}, {error}')
+
+        logger.error(f'callback最终失败，写入死信:{callback_url}, {error}')
+        try:
+            await ExecutorUtil.run(self.outbox.dead_letter, row_ids, callback_url, key, body, error, attempt + 1)
+        except Exception as e:
+            logger.error(f'写入死信异常:{callback_url}, {e}')
+        return False
+
+    async def replay(self, letter_id=None):
+        letters = await ExecutorUtil.run(self.dead_letters.pop, letter_id)
+        for letter in letters:
+            # 重放的回调同样先写入outbox，按原样投递（批量回调的body为数组）
+            row_id = await ExecutorUtil.run(self.outbox.add, letter['callback_url'], letter['key'], letter['body'],
+                                            False, self.owner)
+            self.enqueue(row_id, letter['callback_url'], letter['key'], letter['body'], False)
+        return len(letters)
+
+    async def close(self, timeout=30):
+        # 发送缓冲区中的批量回调，并等待进行中的投递完成；未完成的回调释放租约，由下一个进程继续投递
+        if self.recover_task is not None:
+            self.recover_task.cancel()
+            await asyncio.gather(self.recover_task, return_exceptions=True)
+            self.recover_task = None
+        for buffer_key in list(self.batches.keys()):
+            self.flush(buffer_key)
+        if self.pending:
+            await asyncio.wait(list(self.pending), timeout=timeout)
+        for task in list(self.pending):
+            task.cancel()
+        try:
+            released = await ExecutorUtil.run(self.outbox.release, self.owner)
+            if released:
+                logger.info(f"释放未投递完成的回调: {released}条")
+        except Exception as e:
+            logger.error(f"释放未投递完成的回调异常: {e}")
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
@@ -1,13 +1,9 @@
-import logging
 import re
 from urllib.parse import urlparse
 
-# 设置日志记录
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(filename)s - %(funcName)s - %(lineno)d - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
 
 
 class CommonUtil:
@@ -43,3 +39,18 @@ class CommonUtil:
         else:
             return None
 
+    # 规范化url：忽略协议、www.前缀、末尾/，域名小写，用于缓存等场景判断是否为同一站点
+    @staticmethod
+    def normalize_url(url):
+        if not url:
+            return None
+        url = url.strip()
+        if not url.startswith('http://') and not url.startswith('https://'):
+            url = 'https://' + url
+        parsed = urlparse(url)
+        domain = parsed.netloc.lower()
+        if domain.startswith("www."):
+            domain = domain[4:]
+        path = parsed.path.rstrip("/")
+        query = "?" + parsed.query if parsed.query else ""
+        return domain + path + query
@@ -0,0 +1,9 @@
+import functools
+
+from dotenv import load_dotenv
+
+
+@functools.lru_cache(maxsize=None)
+def load_env():
+    # .env只解析一次，各模块初始化时调用；load_dotenv不覆盖已有环境变量，重复解析没有意义且较慢
+    load_dotenv()
@@ -0,0 +1,39 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from util.env_util import load_env
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+
+class ExecutorUtil:
+    """
+    有界线程池：用于执行没有原生异步客户端的阻塞调用（boto3、Pillow、tokenizer、firecrawl等），避免阻塞事件循环
+    """
+    _executor = None
+
+    @classmethod
+    def get_executor(cls):
+        if cls._executor is None:
+            load_env()
+            max_workers = int(os.getenv('EXECUTOR_MAX_WORKERS', 16))
+            cls._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crawler-blocking')
+            logger.info(f"阻塞调用线程池大小: {max_workers}")
+        return cls._executor
+
+    @classmethod
+    async def run(cls, func, *args, **kwargs):
+        # 复制当前上下文，保证contextvars在线程中可用
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(cls.get_executor(), functools.partial(ctx.run, func, *args, **kwargs))
+
+    @classmethod
+    def shutdown(cls):
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False)
+            cls._executor = None
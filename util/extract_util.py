@@ -0,0 +1,180 @@
+import copy
+import re
+
+from lxml import etree, html
+
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+# 与正文无关、直接删除的标签
+REMOVE_TAGS = ['script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe', 'object', 'embed', 'video',
+               'audio', 'button', 'input', 'select', 'textarea', 'nav', 'footer', 'aside', 'dialog']
+REMOVE_ROLES = {'navigation', 'banner', 'contentinfo', 'dialog', 'alert', 'search', 'menu', 'menubar'}
+NEGATIVE_PATTERN = re.compile(r'nav|footer|menu|sidebar|cookie|consent|banner|advert|\bads?\b|promo|popup|modal|'
+                              r'comment|share|social|subscribe|newsletter|breadcrumb|pagination|related|widget',
+                              re.I)
+POSITIVE_PATTERN = re.compile(r'article|content|main|body|entry|post|text|hero|feature|pricing|faq|product', re.I)
+CANDIDATE_TAGS = {'p', 'div', 'section', 'article', 'main', 'td', 'pre', 'ul', 'ol', 'blockquote'}
+BLOCK_TAGS = {'p', 'div', 'section', 'article', 'main', 'header', 'ul', 'ol', 'table', 'tr', 'blockquote', 'pre',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'dl', 'dt', 'dd', 'figure', 'figcaption', 'br', 'hr'}
+WHITESPACE_PATTERN = re.compile(r'\s+')
+# 抽取的正文短于该长度时，退回整个body的纯文本（如整页包在一个form里的ASP.NET WebForms站点）
+MIN_CONTENT_LENGTH = 50
+
+
+class ExtractUtil:
+    """
+    浏览器路径的正文抽取：lxml解析，删除脚本/样式/导航/页脚等非正文元素，
+    按readability的方式给候选节点打分选出正文区域，输出精简的markdown
+    """
+
+    @staticmethod
+    def get_meta(doc, attr, value):
+        nodes = doc.xpath(f'//meta[@{attr}="{value}"]/@content')
+        return nodes[0].strip() if nodes else ''
+
+    @staticmethod
+    def class_weight(element):
+        weight = 0
+        for value in (element.get('class'), element.get('id')):
+            if not value:
+                continue
+            if NEGATIVE_PATTERN.search(value):
+                weight -= 25
+            if POSITIVE_PATTERN.search(value):
+                weight += 25
+        return weight
+
+    @staticmethod
+    def text_length(element):
+        return len(WHITESPACE_PATTERN.sub(' ', element.text_content()).strip())
+
+    def link_density(self, element):
+        length = self.text_length(element)
+        if not length:
+            return 0
+        link_length = sum(self.text_length(link) for link in element.iter('a'))
+        return link_length / length
+
+    def clean(self, doc):
+        etree.strip_elements(doc, etree.Comment, *REMOVE_TAGS, with_tail=False)
+        for element in list(doc.iter()):
+            if not isinstance(element.tag, str) or element.getparent() is None:
+                continue
+            role = (element.get('role') or '').lower()
+            hidden = element.get('hidden') is not None or element.get('aria-hidden') == 'true'
+            if role in REMOVE_ROLES or hidden:
+                element.drop_tree()
+                continue
+            # 只删除文本较短且带负面class/id的元素，避免误删包裹正文的容器
+            marker = f"{element.get('class') or ''} {element.get('id') or ''}"
+            if element.tag not in ('body', 'html', 'main', 'article') and NEGATIVE_PATTERN.search(marker) \
+                    and not POSITIVE_PATTERN.search(marker) and self.text_length(element) < 1000:
+                element.drop_tree()
+
+    def find_main_content(self, body):
+        # 候选节点打分：按文本长度、逗号数加分，分数累加到父节点和祖父节点
+        scores = {}
+        for element in body.iter(*CANDIDATE_TAGS):
+            text = WHITESPACE_PATTERN.sub(' ', element.text_content()).strip()
+            if len(text) < 25:
+                continue
+            score = 1 + text.count(',') + text.count('，') + min(len(text) // 100, 3)
+            parent = element.getparent()
+            for ancestor, ratio in ((parent, 1), (parent.getparent() if parent is not None else None, 0.5)):
+                if ancestor is None or not isinstance(ancestor.tag, str):
+                    continue
+                if ancestor not in scores:
+                    scores[ancestor] = self.class_weight(ancestor) + (5 if ancestor.tag in ('article', 'main') else 0)
+                scores[ancestor] += score * ratio
+
+        best, best_score = None, 0
+        for element, score in scores.items():
+            score *= 1 - self.link_density(element)
+            if score > best_score:
+                best, best_score = element, score
+
+        # 正文过短时退回整个body（如落地页内容分散在多个区块中）
+        body_length = self.text_length(body)
+        if best is None or self.text_length(best) < max(200, body_length * 0.3):
+            return body
+        return best
+
+    def to_markdown(self, element):
+        parts = []
+        self.render(element, parts)
+        markdown = ''.join(parts)
+        markdown = re.sub(r'[ \t]+\n', '\n', markdown)
+        markdown = re.sub(r'\n{3,}', '\n\n', markdown)
+        return markdown.strip()
+
+    def render(self, element, parts):
+        tag = element.tag if isinstance(element.tag, str) else ''
+        if tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            text = WHITESPACE_PATTERN.sub(' ', element.text_content()).strip()
+            if text:
+                parts.append(f"\n\n{'#' * int(tag[1])} {text}\n\n")
+        elif tag == 'li':
+            text = WHITESPACE_PATTERN.sub(' ', element.text_content()).strip()
+            if text:
+                parts.append(f"\n- {text}")
+        elif tag == 'pre':
+            parts.append(f"\n\n```\n{element.text_content().strip()}\n```\n\n")
+        elif tag == 'tr':
+            cells = [WHITESPACE_PATTERN.sub(' ', cell.text_content()).strip() for cell in element if
+                     isinstance(cell.tag, str) and cell.tag in ('td', 'th')]
+            if any(cells):
+                parts.append('\n| ' + ' | '.join(cells) + ' |')
+        elif tag == 'img':
+            pass
+        elif tag == 'br':
+            parts.append('\n')
+        else:
+            block = tag in BLOCK_TAGS
+            if block:
+                parts.append('\n\n')
+            if element.text:
+                parts.append(WHITESPACE_PATTERN.sub(' ', element.text))
+            for child in element:
+                self.render(child, parts)
+                if child.tail:
+                    parts.append(WHITESPACE_PATTERN.sub(' ', child.tail))
+            if block:
+                parts.append('\n\n')
+
+    def extract(self, origin_content):
+        # 返回title、description和正文markdown
+        result = {'title': '', 'description': '', 'content': ''}
+        if not origin_content or not origin_content.strip():
+            return result
+        try:
+            doc = html.document_fromstring(origin_content)
+        except (etree.ParserError, ValueError) as e:
+            logger.warning(f"解析网页内容失败: {e}")
+            return result
+
+        title = doc.find('.//title')
+        result['title'] = title.text_content().strip() if title is not None else ''
+        result['description'] = self.get_meta(doc, 'name', 'description') or \
+            self.get_meta(doc, 'property', 'og:description')
+
+        body = doc.find('body')
+        if body is None:
+            body = doc
+        # 清理会修改文档，先保留一份原始body用于兜底
+        fallback = copy.deepcopy(body)
+        self.clean(body)
+        result['content'] = self.to_markdown(self.find_main_content(body))
+        if len(result['content']) < MIN_CONTENT_LENGTH:
+            text = self.body_text(fallback)
+            if len(text) > len(result['content']):
+                logger.info(f"抽取的正文过短({len(result['content'])}字符)，使用整个body的文本")
+                result['content'] = text
+        return result
+
+    @staticmethod
+    def body_text(body):
+        # 只去掉脚本和样式，返回整个body的纯文本
+        etree.strip_elements(body, etree.Comment, 'script', 'style', 'noscript', 'template', with_tail=False)
+        return WHITESPACE_PATTERN.sub(' ', ' '.join(body.itertext())).strip()
@@ -0,0 +1,64 @@
+import os
+import threading
+from collections import OrderedDict
+
+from util.env_util import load_env
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+FETCH_PATHS = ('firecrawl', 'browser')
+FETCH_OUTCOMES = ('win', 'fail', 'slow')
+
+
+class FetchStats:
+    """
+    按域名统计firecrawl/浏览器两种爬取方式的结果：
+    - win: 先返回有效结果；fail: 返回失败；slow: 被另一种方式抢先而取消
+    - firecrawl在某域名上失败/过慢比例过高时，该域名直接走浏览器，并定期重新尝试firecrawl
+    """
+
+    def __init__(self):
+        load_env()
+        self.min_samples = int(os.getenv('FETCH_STATS_MIN_SAMPLES', 5))
+        self.browser_threshold = float(os.getenv('FETCH_STATS_BROWSER_THRESHOLD', 0.8))
+        self.probe_every = int(os.getenv('FETCH_STATS_PROBE_EVERY', 20))
+        self.max_domains = int(os.getenv('FETCH_STATS_MAX_DOMAINS', 10000))
+        self.stats = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_domain_stats(self, domain):
+        item = self.stats.get(domain)
+        if item is None:
+            item = {f'{path}_{outcome}': 0 for path in FETCH_PATHS for outcome in FETCH_OUTCOMES}
+            item['skipped'] = 0
+            self.stats[domain] = item
+            while len(self.stats) > self.max_domains:
+                self.stats.popitem(last=False)
+        self.stats.move_to_end(domain)
+        return item
+
+    def record(self, domain, path, outcome):
+        with self.lock:
+            self.get_domain_stats(domain)[f'{path}_{outcome}'] += 1
+
+    def prefer_browser(self, domain):
+        with self.lock:
+            item = self.stats.get(domain)
+            if item is None:
+                return False
+            total = item['firecrawl_win'] + item['firecrawl_fail'] + item['firecrawl_slow']
+            if total < self.min_samples:
+                return False
+            bad_rate = (item['firecrawl_fail'] + item['firecrawl_slow']) / total
+            if bad_rate < self.browser_threshold:
+                return False
+            # 定期放行一次firecrawl，让统计有机会恢复
+            item['skipped'] += 1
+            if self.probe_every and item['skipped'] % self.probe_every == 0:
+                return False
+            return True
+
+    def snapshot(self):
+        with self.lock:
+            return {domain: dict(item) for domain, item in self.stats.items()}
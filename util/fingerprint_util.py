@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+from util.common_util import CommonUtil
+from util.env_util import load_env
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+
+def content_hash(title, description, content):
+    # 规范化后的文本哈希：合并空白、忽略大小写，避免排版差异导致误判为变化
+    text = '\n'.join(part or '' for part in (title, description, content))
+    text = re.sub(r'\s+', ' ', text).strip().lower()
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def hash_distance(hash1, hash2):
+    # 两个感知哈希（16进制）的汉明距离，任一为空时视为完全不同
+    if not hash1 or not hash2 or len(hash1) != len(hash2):
+        return None
+    return bin(int(hash1, 16) ^ int(hash2, 16)).count('1')
+
+
+class FingerprintStore:
+    """
+    增量爬取的站点指纹（SQLite）：每个规范化url保存ETag/Last-Modified、内容哈希、截图感知哈希和上次的处理结果
+    """
+
+    def __init__(self):
+        load_env()
+        self.db_path = os.getenv('FINGERPRINT_DB_PATH', './data/fingerprints.db')
+        # 截图感知哈希的汉明距离不超过该值时认为页面外观未变化
+        self.max_distance = int(os.getenv('FINGERPRINT_PHASH_DISTANCE', 10))
+        # 是否先发送HEAD请求比较ETag/Last-Modified，未变化时不再爬取页面
+        self.preflight_enabled = os.getenv('FINGERPRINT_PREFLIGHT_ENABLED', 'true').lower() == 'true'
+        self.preflight_timeout = float(os.getenv('FINGERPRINT_PREFLIGHT_TIMEOUT', 10))
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS fingerprints ('
+                         'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, '
+                         'screenshot_hash TEXT, tag_list TEXT, result TEXT NOT NULL, updated_at REAL NOT NULL)')
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get(self, url):
+        with self.connect() as conn:
+            row = conn.execute('SELECT * FROM fingerprints WHERE url = ?',
+                               (CommonUtil.normalize_url(url),)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record['tag_list'] = json.loads(record['tag_list']) if record['tag_list'] else None
+        record['result'] = json.loads(record['result'])
+        return record
+
+    def save(self, url, etag, last_modified, content_hash, screenshot_hash, tag_list, result):
+        with self.connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO fingerprints (url, etag, last_modified, content_hash, screenshot_hash, '
+                         'tag_list, result, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (CommonUtil.normalize_url(url), etag, last_modified, content_hash, screenshot_hash,
+                          json.dumps(tag_list, ensure_ascii=False) if tag_list else None,
+                          json.dumps(result, ensure_ascii=False), time.time()))
+
+    def is_same_screenshot(self, hash1, hash2):
+        distance = hash_distance(hash1, hash2)
+        return distance is not None and distance <= self.max_distance
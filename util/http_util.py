@@ -0,0 +1,49 @@
+import os
+
+import httpx
+
+from util.env_util import load_env
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+
+class HttpUtil:
+    """
+    共享的异步HTTP客户端，复用连接池
+    """
+    _client = None
+
+    @classmethod
+    def get_client(cls):
+        if cls._client is None or cls._client.is_closed:
+            load_env()
+            timeout = float(os.getenv('HTTP_TIMEOUT_SECONDS', 30))
+            max_connections = int(os.getenv('HTTP_MAX_CONNECTIONS', 100))
+            cls._client = httpx.AsyncClient(
+                timeout=timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections // 5),
+            )
+        return cls._client
+
+    @classmethod
+    async def get_bytes(cls, url, headers=None):
+        response = await cls.get_client().get(url, headers=headers)
+        response.raise_for_status()
+        return response.content
+
+    @classmethod
+    async def warm_up(cls, urls):
+        # 预先建立到常用地址的连接，放入连接池复用；失败不影响后续请求
+        for url in urls:
+            try:
+                await cls.get_client().head(url)
+            except Exception as e:
+                logger.warning(f"预热连接{url}失败: {e}")
+
+    @classmethod
+    async def close(cls):
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
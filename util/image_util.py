@@ -0,0 +1,118 @@
+import os
+from io import BytesIO
+
+from PIL import Image
+
+from util.env_util import load_env
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+# 配置格式 -> (Pillow格式, 文件后缀, Content-Type)
+IMAGE_FORMATS = {
+    'png': ('PNG', 'png', 'image/png'),
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+    'jpg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+
+
+class EncodedImage:
+    def __init__(self, data, extension, content_type, width, height):
+        self.data = data
+        self.extension = extension
+        self.content_type = content_type
+        self.width = width
+        self.height = height
+
+
+class ImageUtil:
+    """
+    截图编码与缩略图生成：截图只解码一次，按配置的格式/质量编码，并生成多个尺寸的缩略图
+    """
+
+    def __init__(self):
+        load_env()
+        self.screenshot_format = self.get_format(os.getenv('SCREENSHOT_FORMAT', 'png'))
+        self.screenshot_quality = int(os.getenv('SCREENSHOT_QUALITY', 80))
+        self.thumbnail_format = self.get_format(os.getenv('THUMBNAIL_FORMAT', 'png'))
+        self.thumbnail_quality = int(os.getenv('THUMBNAIL_QUALITY', 80))
+        # 缩略图尺寸，逗号分隔：小于等于1的小数为缩放比例，整数为目标宽度；第一个作为默认缩略图
+        self.thumbnail_sizes = [float(size) for size in os.getenv('THUMBNAIL_SIZES', '0.5').split(',') if size.strip()]
+
+    @staticmethod
+    def get_format(name):
+        image_format = IMAGE_FORMATS.get(name.strip().lower())
+        if image_format is None:
+            raise ValueError(f"不支持的图片格式: {name}")
+        return image_format
+
+    def get_thumbnail_dimensions(self, width, height):
+        dimensions = []
+        for size in self.thumbnail_sizes:
+            new_width = int(width * size) if size <= 1 else min(int(size), width)
+            new_height = max(1, int(height * new_width / width))
+            dimensions.append((max(1, new_width), new_height))
+        return dimensions
+
+    def encode(self, image, image_format, quality):
+        pillow_format, extension, content_type = image_format
+        if pillow_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        # quality只对webp/jpeg生效
+        image.save(buffer, format=pillow_format, quality=quality)
+        return EncodedImage(buffer.getvalue(), extension, content_type, image.width, image.height)
+
+    @staticmethod
+    def resize(image, dimensions):
+        # 先用reduce按整数倍快速缩小，再精确缩放到目标尺寸
+        factor = min(image.width // dimensions[0], image.height // dimensions[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+        if image.size != dimensions:
+            image = image.resize(dimensions, Image.BILINEAR)
+        return image
+
+    def process_screenshot(self, image_data):
+        # 返回 (截图, [缩略图...])
+        image = Image.open(BytesIO(image_data))
+        width, height = image.size
+        source_format = IMAGE_FORMATS.get((image.format or '').lower())
+        thumbnail_dimensions = self.get_thumbnail_dimensions(width, height)
+
+        # 源格式与配置一致时直接使用原始数据，无需重新编码
+        keep_original = source_format is not None and source_format[0] == self.screenshot_format[0]
+        if keep_original:
+            screenshot = EncodedImage(image_data, source_format[1], source_format[2], width, height)
+            if image.format == 'JPEG' and thumbnail_dimensions:
+                # JPEG可以在解码时直接按缩略图尺寸降采样
+                image.draft('RGB', max(thumbnail_dimensions))
+        image.load()
+        if not keep_original:
+            screenshot = self.encode(image, self.screenshot_format, self.screenshot_quality)
+
+        thumbnails = [self.encode(self.resize(image, dimensions), self.thumbnail_format, self.thumbnail_quality)
+                      for dimensions in thumbnail_dimensions]
+        logger.info(f"截图编码完成: {screenshot.extension} {len(screenshot.data)} bytes, "
+                    f"缩略图: {[(t.width, t.height, len(t.data)) for t in thumbnails]}")
+        return screenshot, thumbnails
+
+    @staticmethod
+    def perceptual_hash(image_data, hash_size=8):
+        # 差值哈希（dHash）：缩小为灰度图后分别比较水平、垂直相邻像素的亮度，返回16进制字符串
+        # 同时使用两个方向，横向色带为主的页面也能区分；外观相近的截图哈希距离小
+        image = Image.open(BytesIO(image_data))
+        if image.format == 'JPEG':
+            image.draft('L', (hash_size * 8, hash_size * 8))
+        image = image.convert('L').resize((hash_size + 1, hash_size + 1), Image.BILINEAR)
+        pixels = list(image.getdata())
+        width = hash_size + 1
+        bits = 0
+        for row in range(hash_size):
+            for col in range(hash_size):
+                bits = (bits << 1) | (1 if pixels[row * width + col] > pixels[row * width + col + 1] else 0)
+        for row in range(hash_size):
+            for col in range(hash_size):
+                bits = (bits << 1) | (1 if pixels[row * width + col] > pixels[(row + 1) * width + col] else 0)
+        return f"{bits:0{hash_size * hash_size // 2}x}"
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+from util.env_util import load_env
+from util.executor_util import ExecutorUtil
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+JOB_STATUS_PENDING = 'pending'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_SUCCESS = 'success'
+JOB_STATUS_FAILED = 'failed'
+
+
+class JobQueue:
+    """
+    基于SQLite的持久化任务队列，多个uvicorn worker共享：
+    - 租约机制保证至少一次处理：worker崩溃后租约过期，任务会被重新领取
+    - 失败按指数退避重试，超过最大次数后标记为failed；租约过期且次数已用完的任务（worker崩溃或卡死）也标记为failed
+    - 已结束的任务保留JOB_RETENTION_SECONDS后删除
+    - 调用方可传入幂等key，重复提交返回已有任务
+    """
+
+    def __init__(self):
+        load_env()
+        self.db_path = os.getenv('JOB_DB_PATH', './data/jobs.db')
+        self.max_attempts = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+        self.lease_seconds = int(os.getenv('JOB_LEASE_SECONDS', 600))
+        self.retry_delay = float(os.getenv('JOB_RETRY_DELAY', 30))
+        # 已结束（success/failed）任务的保留时间，0表示不删除
+        self.retention_seconds = float(os.getenv('JOB_RETENTION_SECONDS', 7 * 24 * 3600))
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                         'id TEXT PRIMARY KEY, idempotency_key TEXT UNIQUE, payload TEXT NOT NULL, '
+                         'status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, '
+                         'result TEXT, error TEXT, available_at REAL NOT NULL, lease_until REAL, '
+                         'created_at REAL NOT NULL, updated_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_updated ON jobs (status, updated_at)')
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def to_job(row, include_result=False):
+        if row is None:
+            return None
+        job = {
+            'id': row['id'],
+            'idempotency_key': row['idempotency_key'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'max_attempts': row['max_attempts'],
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'payload': json.loads(row['payload']),
+        }
+        if include_result:
+            job['result'] = json.loads(row['result']) if row['result'] else None
+        return job
+
+    def enqueue(self, payload, idempotency_key=None):
+        # 返回 (任务, 是否新建)
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self.connect() as conn:
+            try:
+                conn.execute('INSERT INTO jobs (id, idempotency_key, payload, status, max_attempts, available_at, '
+                             'created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (job_id, idempotency_key, json.dumps(payload, ensure_ascii=False), JOB_STATUS_PENDING,
+                              self.max_attempts, now, now, now))
+                created = True
+            except sqlite3.IntegrityError:
+                row = conn.execute('SELECT id FROM jobs WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+                job_id = row['id']
+                created = False
+        return self.get(job_id), created
+
+    def claim(self):
+        # 领取一个可执行的任务：待处理且到达执行时间，或租约已过期且未超过最大次数的运行中任务
+        # 返回 (任务, 本次因租约过期且次数用完而标记为failed的任务列表)
+        now = time.time()
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            expired = conn.execute('SELECT id FROM jobs WHERE status = ? AND lease_until < ? '
+                                   'AND attempts >= max_attempts', (JOB_STATUS_RUNNING, now)).fetchall()
+            for row in expired:
+                conn.execute('UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?',
+                             (JOB_STATUS_FAILED, 'lease expired after max attempts', now, row['id']))
+            row = conn.execute('SELECT id FROM jobs WHERE (status = ? AND available_at <= ?) '
+                               'OR (status = ? AND lease_until < ? AND attempts < max_attempts) '
+                               'ORDER BY available_at LIMIT 1',
+                               (JOB_STATUS_PENDING, now, JOB_STATUS_RUNNING, now)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ? '
+                             'WHERE id = ?', (JOB_STATUS_RUNNING, now + self.lease_seconds, now, row['id']))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        failed = [self.get(item['id']) for item in expired]
+        if failed:
+            logger.warning(f"租约过期且已达最大次数，标记为failed: {[job['id'] for job in failed]}")
+        return (self.get(row['id']) if row is not None else None), failed
+
+    def extend_lease(self, job_id):
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute('UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = ?',
+                         (now + self.lease_seconds, now, job_id, JOB_STATUS_RUNNING))
+
+    def complete(self, job_id, result):
+        status = JOB_STATUS_SUCCESS if result is not None else JOB_STATUS_FAILED
+        with self.connect() as conn:
+            conn.execute('UPDATE jobs SET status = ?, result = ?, lease_until = NULL, updated_at = ? WHERE id = ?',
+                         (status, json.dumps(result, ensure_ascii=False), time.time(), job_id))
+
+    def fail(self, job, error):
+        # 未超过最大次数时按指数退避重新排队；返回任务是否已最终失败
+        now = time.time()
+        with self.connect() as conn:
+            if job['attempts'] < job['max_attempts']:
+                delay = self.retry_delay * (2 ** (job['attempts'] - 1))
+                conn.execute('UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_until = NULL, '
+                             'updated_at = ? WHERE id = ?', (JOB_STATUS_PENDING, error, now + delay, now, job['id']))
+                return False
+            conn.execute('UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?',
+                         (JOB_STATUS_FAILED, error, now, job['id']))
+            return True
+
+    def cleanup(self):
+        # 删除超过保留时间的已结束任务，返回删除条数
+        if self.retention_seconds <= 0:
+            return 0
+        with self.connect() as conn:
+            cursor = conn.execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                                  (JOB_STATUS_SUCCESS, JOB_STATUS_FAILED, time.time() - self.retention_seconds))
+        if cursor.rowcount:
+            logger.info(f"清理已结束任务: {cursor.rowcount}条")
+        return cursor.rowcount
+
+    def get(self, job_id, include_result=False):
+        with self.connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self.to_job(row, include_result)
+
+    def count_by_status(self):
+        with self.connect() as conn:
+            rows = conn.execute('SELECT status, COUNT(*) AS total FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['total'] for row in rows}
+
+
+class JobWorkerPool:
+    """
+    任务处理worker池：固定数量的后台协程轮询领取任务，与请求处理分离；
+    任务最终失败（处理异常且次数用完，或租约过期且次数用完）时调用on_failed，另有一个协程定期清理已结束的任务
+    """
+
+    def __init__(self, queue, handler, on_failed=None):
+        load_env()
+        self.queue = queue
+        self.handler = handler
+        self.on_failed = on_failed
+        self.size = int(os.getenv('JOB_WORKERS', 2))
+        self.poll_interval = float(os.getenv('JOB_POLL_INTERVAL', 1))
+        self.cleanup_interval = float(os.getenv('JOB_CLEANUP_INTERVAL', 3600))
+        self.tasks = []
+
+    def start(self):
+        if self.tasks:
+            return
+        logger.info(f"启动任务worker数: {self.size}")
+        self.tasks = [asyncio.create_task(self.run_worker(index)) for index in range(self.size)]
+        self.tasks.append(asyncio.create_task(self.run_cleanup()))
+
+    async def run_cleanup(self):
+        while True:
+            try:
+                await ExecutorUtil.run(self.queue.cleanup)
+            except Exception as e:
+                logger.error(f"清理已结束任务异常: {e}")
+            await asyncio.sleep(self.cleanup_interval)
+
+    async def notify_failed(self, job):
+        if self.on_failed is None:
+            return
+        try:
+            await self.on_failed(job)
+        except Exception as e:
+            logger.error(f"任务失败回调异常:{job['id']}, {e}")
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def keep_lease(self, job_id):
+        # 处理时间较长时定期续租，避免任务被重复领取
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            await ExecutorUtil.run(self.queue.extend_lease, job_id)
+
+    async def run_worker(self, index):
+        while True:
+            try:
+                job, failed = await ExecutorUtil.run(self.queue.claim)
+            except Exception as e:
+                logger.error(f"worker{index}领取任务异常: {e}")
+                job, failed = None, []
+            for failed_job in failed:
+                await self.notify_failed(failed_job)
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            logger.info(f"worker{index}开始处理任务:{job['id']}, 第{job['attempts']}次")
+            lease_task = asyncio.create_task(self.keep_lease(job['id']))
+            try:
+                result = await self.handler(job)
+                await ExecutorUtil.run(self.queue.complete, job['id'], result)
+                logger.info(f"worker{index}任务处理完成:{job['id']}")
+            except asyncio.CancelledError:
+                # 进程退出时不修改任务状态，租约过期后由其他worker重新处理
+                raise
+            except Exception as e:
+                logger.error(f"worker{index}任务处理失败:{job['id']}, {e}")
+                if await ExecutorUtil.run(self.queue.fail, job, str(e)):
+                    await self.notify_failed(await ExecutorUtil.run(self.queue.get, job['id']))
+            finally:
+                lease_task.cancel()
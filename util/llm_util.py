@@ -1,55 +1,99 @@
+import asyncio
+import json
 import os
-from dotenv import load_dotenv
-from groq import Groq
-from openai import OpenAI
-import logging
-from transformers import LlamaTokenizer
+import re
+from util.cache_util import CompletionCache
 from util.common_util import CommonUtil
+from util.env_util import load_env
+from util.executor_util import ExecutorUtil
+from util.log_util import get_logger
+from util.metrics_util import MetricsUtil
+from util.provider_util import ProviderPool
+from util.token_util import TokenUtil
 
-# 设置日志记录
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(filename)s - %(funcName)s - %(lineno)d - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 util = CommonUtil()
-# 初始化LLaMA模型的Tokenizer
-tokenizer = LlamaTokenizer.from_pretrained("huggyllama/llama-65b")
+
+DEFAULT_LANGUAGE_BATCH_SYS_PROMPT = (
+    'The input is a JSON object whose values are texts to translate. Translate every value into each of these '
+    'languages: {languages}. Keep the original format of each value (if a value is markdown, its translation is also '
+    'markdown), easy understand. Output only a JSON object whose keys are exactly the language names above, and whose '
+    'values are objects with the same keys as the input holding the translations. Not need output note!'
+)
+
+# detail+tags单次调用：在DETAIL_SYS_PROMPT之后追加的输出格式要求
+DEFAULT_DETAIL_TAGS_SYS_PROMPT = (
+    'Output only a JSON object with two keys: "detail" is the markdown content described above, "tags" is an array '
+    'of several suitable tags selected from the tag_list, tags cannot be created, tags can only be selected from '
+    'tag_list. The tag_list is: {tag_list}. Not need output note!'
+)
+
+
+def is_english(language):
+    return 'english' in language.lower()
+
+
+def clean_translation(user_prompt, result):
+    if result and user_prompt and not user_prompt.startswith("#"):
+        # 如果原始输入没有包含###开头的markdown标记，则去掉markdown标记
+        result = result.replace("### ", "").replace("## ", "").replace("# ", "").replace("**", "")
+    return result
+
+
+def parse_json_object(text):
+    # 解析LLM返回的JSON对象，兼容```json代码块包裹的情况
+    if not text:
+        return None
+    text = re.sub(r'^\s*```(?:json)?\s*|\s*```\s*$', '', text)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
 
 class LLMUtil:
     def __init__(self):
-        load_dotenv()
+        load_env()
         self.source = os.getenv('API_SOURCE')
-        if self.source == 'openrouter':
-            self.groq_api_key = os.getenv('OPENROUTER_API_KEY')
-            self.groq_model = os.getenv('OPENROUTER_MODEL')
-            self.client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=os.getenv("OPENROUTER_API_KEY"),
-            )
-        elif self.source == 'groq':
-            self.groq_api_key = os.getenv('GROQ_API_KEY')
-            self.groq_model = os.getenv('GROQ_MODEL')
-            self.client = Groq(
-                api_key=self.groq_api_key
-            )
+        # LLM后端池：多个key/后端按限流额度与权重分配请求，失败时切换后端
+        self.providers = ProviderPool()
+        self.groq_model = self.providers.model
         self.detail_sys_prompt = os.getenv('DETAIL_SYS_PROMPT')
         self.tag_selector_sys_prompt = os.getenv('TAG_SELECTOR_SYS_PROMPT')
         self.language_sys_prompt = os.getenv('LANGUAGE_SYS_PROMPT')
+        # 多语言单次调用模式：一次请求返回所有语言的title/description/detail
+        self.language_batch_mode = os.getenv('LANGUAGE_BATCH_MODE', 'false').lower() == 'true'
+        self.language_batch_sys_prompt = os.getenv('LANGUAGE_BATCH_SYS_PROMPT', DEFAULT_LANGUAGE_BATCH_SYS_PROMPT)
+        # detail+tags单次调用模式：一次请求返回detail与选中的tags，结果无效时回退为两次调用
+        self.detail_tags_mode = os.getenv('DETAIL_TAGS_MODE', 'false').lower() == 'true'
+        self.detail_tags_sys_prompt = os.getenv('DETAIL_TAGS_SYS_PROMPT', DEFAULT_DETAIL_TAGS_SYS_PROMPT)
         self.groq_max_tokens = int(os.getenv('GROQ_MAX_TOKENS', 5000))
+        # 按token预算截取用户输入，tokenizer懒加载
+        self.token_util = TokenUtil()
+        self.temperature = 1.0
+        # LLM结果缓存，相同的模型/提示词/输入直接返回缓存结果
+        self.completion_cache = CompletionCache()
+        # 多语言翻译并发数
+        self.language_concurrency = int(os.getenv('LANGUAGE_CONCURRENCY', 6))
         logger.info(f"API source:{self.source}")
-        logger.info(f"API Key:{self.groq_api_key[:10]}")
+        logger.info(f"API providers:{len(self.providers.providers)}")
         logger.info(f"using model: {self.groq_model}")
         logger.info(f"max tokens: {self.groq_max_tokens}")
+        logger.info(f"language concurrency: {self.language_concurrency}")
+        logger.info(f"language batch mode: {self.language_batch_mode}")
+        logger.info(f"detail tags mode: {self.detail_tags_mode}")
         
 
-    def process_detail(self, user_prompt):
+    async def process_detail(self, user_prompt, on_delta=None):
+        # on_delta不为空时流式生成，每收到一段文本回调一次
         logger.info("正在处理Detail...")
-        return util.detail_handle(self.process_prompt(self.detail_sys_prompt, user_prompt))
+        return util.detail_handle(await self.process_prompt(self.detail_sys_prompt, user_prompt,
+                                                                call_type='detail', on_delta=on_delta))
 
-    def process_tags(self, user_prompt):
+    async def process_tags(self, user_prompt):
         logger.info(f"正在处理tags...")
-        result = self.process_prompt(self.tag_selector_sys_prompt, user_prompt)
+        result = await self.process_prompt(self.tag_selector_sys_prompt, user_prompt, call_type='tags')
         # 将result（逗号分割的字符串）转为数组
         if result:
             tags = [element.strip() for element in result.split(',')]
@@ -58,20 +102,150 @@ class LLMUtil:
         logger.info(f"tags处理结果:{tags}")
         return tags
 
-    def process_language(self, language, user_prompt):
+    async def process_detail_and_tags(self, content, tags, on_detail_delta=None):
+        # 生成detail，tags非空时选出合适的tags；返回 (detail, tags)，tags为空时返回的tags为None
+        # on_detail_delta只在单独生成detail时生效，单次调用模式返回的是JSON，不做流式输出
+        if tags and self.detail_tags_mode:
+            detail, selected_tags = await self.process_detail_tags_combined(content, tags)
+            if detail:
+                if selected_tags is None:
+                    # detail有效但tags无效，只补一次tags调用
+                    selected_tags = await self.process_tags('tag_list is:' + ','.join(tags) + '. content is: ' + detail)
+                return detail, selected_tags
+            logger.warning("detail+tags单次调用失败，回退为两次调用")
+
+        detail = await self.process_detail(content, on_delta=on_detail_delta)
+        selected_tags = None
+        if tags and detail:
+            selected_tags = await self.process_tags('tag_list is:' + ','.join(tags) + '. content is: ' + detail)
+        return detail, selected_tags
+
+    async def process_detail_tags_combined(self, content, tags):
+        # 一次LLM调用同时生成detail与tags，返回 (detail, tags)，无效的部分返回None
+        if not self.detail_sys_prompt:
+            return None, None
+        logger.info("正在单次调用处理Detail与tags...")
+        sys_prompt = self.detail_sys_prompt + '\n' + self.detail_tags_sys_prompt.replace(
+            "{tag_list}", json.dumps(tags, ensure_ascii=False))
+        result = await self.process_prompt(sys_prompt, content, response_format={"type": "json_object"},
+                                           call_type='detail_tags')
+        data = parse_json_object(result)
+        if data is None:
+            logger.warning(f"detail+tags单次调用结果不是合法JSON:{result}")
+            return None, None
+
+        # 校验结构：detail为非空字符串，tags为字符串数组且只保留tag_list中的tag（大小写不敏感，按原始写法返回）
+        detail = data.get('detail')
+        detail = util.detail_handle(detail) if isinstance(detail, str) and detail.strip() else None
+        selected_tags = data.get('tags')
+        if isinstance(selected_tags, list):
+            allowed = {tag.strip().lower(): tag for tag in tags}
+            selected_tags = list(dict.fromkeys(allowed[tag.strip().lower()] for tag in selected_tags
+                                               if isinstance(tag, str) and tag.strip().lower() in allowed))
+        else:
+            selected_tags = None
+        logger.info(f"detail+tags单次调用完成，tags:{selected_tags}")
+        return detail, selected_tags
+
+    async def process_language(self, language, user_prompt):
         logger.info(f"正在处理多语言:{language}, user_prompt:{user_prompt}")
         # 如果language 包含 English字符，则直接返回
-        if 'english'.lower() in language.lower():
+        if is_english(language):
             result = user_prompt
         else:
-            result = self.process_prompt(self.language_sys_prompt.replace("{language}", language), user_prompt)
-            if result and not user_prompt.startswith("#"):
-                # 如果原始输入没有包含###开头的markdown标记，则去掉markdown标记
-                result = result.replace("### ", "").replace("## ", "").replace("# ", "").replace("**", "")
+            result = await self.process_prompt(self.language_sys_prompt.replace("{language}", language), user_prompt,
+                                               call_type='language')
+            result = clean_translation(user_prompt, result)
         logger.info(f"多语言:{language}, 处理结果:{result}")
         return result
 
-    def process_prompt(self, sys_prompt, user_prompt):
+    async def process_languages(self, languages, title, description, detail, on_language=None):
+        # 并发处理所有语言的title/description/detail，结果按languages原始顺序返回
+        # on_language不为空时，每个语言的所有字段完成后回调一次
+        if not languages:
+            return []
+        fields = {'title': title, 'description': description, 'detail': detail}
+
+        # 单次调用模式：一次请求翻译所有语言，缺失或无效的条目再逐个字段补齐
+        translated = {}
+        if self.language_batch_mode:
+            translated = await self.process_languages_batch(languages, fields)
+
+        semaphore = asyncio.Semaphore(self.language_concurrency)
+
+        def build_entry(language):
+            return {'language': language, 'title': translated[(language, 'title')],
+                    'description': translated[(language, 'description')],
+                    'detail': translated[(language, 'detail')]}
+
+        missing = list(dict.fromkeys((language, field) for language in languages for field in fields
+                                     if (language, field) not in translated))
+        if self.language_batch_mode and missing:
+            logger.info(f"多语言单次调用缺失{len(missing)}个条目，逐个字段补齐")
+        # 每个语言未完成的字段数，降为0时该语言完成
+        pending = {language: 0 for language in languages}
+        for language, _ in missing:
+            pending[language] += 1
+        if on_language:
+            for language, count in pending.items():
+                if count == 0:
+                    await on_language(build_entry(language))
+
+        async def translate(language, field):
+            async with semaphore:
+                try:
+                    result = await self.process_language(language, fields[field])
+                except Exception as e:
+                    # 单个调用失败不影响其他语言，失败的字段置为None
+                    logger.error(f"多语言:{language} {field} 处理异常: {e}")
+                    result = None
+            translated[(language, field)] = result
+            pending[language] -= 1
+            if on_language and pending[language] == 0:
+                await on_language(build_entry(language))
+
+        await asyncio.gather(*[translate(language, field) for language, field in missing])
+        return [build_entry(language) for language in languages]
+
+    async def process_languages_batch(self, languages, fields):
+        # 一次LLM调用将title/description/detail翻译为所有语言，返回 {(language, field): 译文}
+        translated = {}
+        target_languages = []
+        for language in languages:
+            if is_english(language):
+                for field, text in fields.items():
+                    translated[(language, field)] = text
+            elif language not in target_languages:
+                target_languages.append(language)
+
+        source = {field: text for field, text in fields.items() if text}
+        if not target_languages or not source:
+            return translated
+
+        logger.info(f"正在单次调用处理多语言:{target_languages}")
+        sys_prompt = self.language_batch_sys_prompt.replace("{languages}", json.dumps(target_languages,
+                                                                                      ensure_ascii=False))
+        result = await self.process_prompt(sys_prompt, json.dumps(source, ensure_ascii=False),
+                                           response_format={"type": "json_object"}, call_type='language_batch')
+        data = parse_json_object(result)
+        if data is None:
+            logger.warning(f"多语言单次调用结果不是合法JSON:{result}")
+            return translated
+
+        # 校验结构：只接受请求的语言与字段，且值为非空字符串
+        for language in target_languages:
+            entry = data.get(language)
+            if not isinstance(entry, dict):
+                continue
+            for field, text in source.items():
+                value = entry.get(field)
+                if isinstance(value, str) and value.strip():
+                    translated[(language, field)] = clean_translation(text, value)
+        logger.info(f"多语言单次调用完成，有效条目数:{len(translated)}")
+        return translated
+
+    async def process_prompt(self, sys_prompt, user_prompt, response_format=None, use_cache=True, call_type='prompt',
+                             on_delta=None):
         if not sys_prompt:
             logger.info(f"LLM无需处理，sys_prompt为空:{sys_prompt}")
             return None
@@ -81,17 +255,35 @@ class LLMUtil:
 
         logger.info("LLM正在处理")
         try:
-            tokens = tokenizer.encode(user_prompt)
-            if len(tokens) > self.groq_max_tokens:
-                logger.info(f"用户输入长度超过{self.groq_max_tokens}，进行截取")
-                truncated_tokens = tokens[:self.groq_max_tokens]
-                user_prompt = tokenizer.decode(truncated_tokens)
-
-            chat_completion = self.client.chat.completions.create(
-                extra_headers={
+            # tokenizer为CPU密集操作，放到线程池中执行
+            with MetricsUtil.stage('truncate'):
+                user_prompt = await ExecutorUtil.run(self.token_util.truncate, user_prompt, self.groq_max_tokens)
+
+            # 结果缓存，需要每次生成不同结果的调用可传入use_cache=False
+            use_cache = use_cache and self.completion_cache.enabled
+            cache_key = None
+            if use_cache:
+                cache_key = self.completion_cache.build_key(self.providers.models, sys_prompt, self.temperature,
+                                                            response_format, user_prompt)
+                cached = await self.completion_cache.get(cache_key)
+                if cached is not None:
+                    logger.info("LLM命中缓存")
+                    MetricsUtil.record_llm(call_type, 'cache')
+                    if on_delta:
+                        await on_delta(cached)
+                    return cached
+
+            # 需要结构化输出时，要求模型返回JSON
+            extra_params = {}
+            if response_format:
+                extra_params['response_format'] = response_format
+
+            request = dict(
+                # 未配置的header不发送，header值为None时客户端会报错
+                extra_headers={key: value for key, value in {
                     "HTTP-Referer": os.getenv('SITE_URL'), # Optional, for including your app on openrouter.ai rankings.
                     "X-Title": os.getenv('APP_NAME'), # Optional. Shows in rankings on openrouter.ai.
-                },
+                }.items() if value},
                 messages=[
                     {
                         "role": "system",
@@ -102,15 +294,23 @@ class LLMUtil:
                         "content": user_prompt,
                     }
                 ],
-                model=self.groq_model,
-                temperature=1.0,
+                temperature=self.temperature,
+                **extra_params,
             )
-            if chat_completion.choices[0] and chat_completion.choices[0].message:
-                logger.info(f"LLM完成处理，成功响应!")
-                return chat_completion.choices[0].message.content
+            with MetricsUtil.stage(f'llm_{call_type}'):
+                # 由后端池选择模型与key，on_delta不为空时流式调用
+                content, usage, model = await self.providers.complete(request, on_delta)
+            if content:
+                logger.info(f"LLM完成处理，成功响应! 模型:{model}")
+                MetricsUtil.record_llm(call_type, 'success', usage)
+                if use_cache:
+                    await self.completion_cache.set(cache_key, content)
+                return content
             else:
                 logger.info("LLM完成处理，处理结果为空")
+                MetricsUtil.record_llm(call_type, 'empty', usage)
                 return None
         except Exception as e:
-            logger.error(f"LLM处理失败", e)
+            logger.error(f"LLM处理失败: {e}")
+            MetricsUtil.record_llm(call_type, 'fail')
             return None
\ No newline at end of file
@@ -0,0 +1,13 @@
+import logging
+import os
+
+from util.env_util import load_env
+
+LOG_FORMAT = '%(asctime)s - %(filename)s - %(funcName)s - %(lineno)d - %(levelname)s - %(message)s'
+
+
+def get_logger(name):
+    # 统一的日志配置，第一次获取logger时初始化（已配置过handler时basicConfig不会重复生效），日志级别可用LOG_LEVEL配置
+    load_env()
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format=LOG_FORMAT)
+    return logging.getLogger(name)
@@ -0,0 +1,102 @@
+import contextvars
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+# 当前请求的分阶段耗时，供响应中返回
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram('crawler_stage_seconds', '各处理阶段耗时（秒）', ['stage'], buckets=STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram('crawler_request_seconds', '接口请求耗时（秒）', ['endpoint'], buckets=STAGE_BUCKETS)
+REQUESTS = Counter('crawler_requests_total', '接口请求数', ['endpoint', 'code'])
+LLM_REQUESTS = Counter('crawler_llm_requests_total', 'LLM调用数', ['call', 'status'])
+LLM_TOKENS = Counter('crawler_llm_tokens_total', 'LLM token数', ['call', 'type'])
+LLM_PROVIDER_REQUESTS = Counter('crawler_llm_provider_requests_total', '各LLM后端的调用数', ['provider', 'status'])
+CACHE_REQUESTS = Counter('crawler_cache_requests_total', '缓存查询数', ['cache', 'result'])
+BROWSER_PAGES_IN_USE = Gauge('crawler_browser_pages_in_use', '正在使用的浏览器页面数', multiprocess_mode='livesum')
+BROWSER_PAGES_WAITING = Gauge('crawler_browser_pages_waiting', '等待浏览器页面的请求数', multiprocess_mode='livesum')
+BROWSER_LAUNCHES = Counter('crawler_browser_launches_total', '浏览器启动次数')
+SCHEDULER_RUNNING = Gauge('crawler_scheduler_running', '调度器中正在执行的爬取数', multiprocess_mode='livesum')
+SCHEDULER_WAITING = Gauge('crawler_scheduler_waiting', '调度器中排队等待的爬取数', ['priority'],
+                          multiprocess_mode='livesum')
+SCHEDULER_REJECTED = Counter('crawler_scheduler_rejected_total', '调度器拒绝（429）的请求数')
+JOB_QUEUE_DEPTH = Gauge('crawler_job_queue_depth', '任务队列中各状态的任务数', ['status'],
+                        multiprocess_mode='mostrecent')
+
+
+class Stage:
+    # 阶段计时：记录到Prometheus直方图，并累加到当前请求的耗时明细（并发的同名阶段耗时会累加）
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.labels(self.name).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[self.name] = round(timings.get(self.name, 0) + elapsed, 4)
+        return False
+
+
+class MetricsUtil:
+
+    @staticmethod
+    def stage(name):
+        return Stage(name)
+
+    @staticmethod
+    def start_request():
+        # 开始记录当前请求的耗时明细，返回明细字典
+        timings = {}
+        _request_timings.set(timings)
+        return timings
+
+    @staticmethod
+    def record_request(endpoint, code, seconds):
+        REQUESTS.labels(endpoint, str(code)).inc()
+        REQUEST_SECONDS.labels(endpoint).observe(seconds)
+
+    @staticmethod
+    def record_llm(call, status, usage=None):
+        LLM_REQUESTS.labels(call, status).inc()
+        if usage is not None:
+            LLM_TOKENS.labels(call, 'prompt').inc(getattr(usage, 'prompt_tokens', 0) or 0)
+            LLM_TOKENS.labels(call, 'completion').inc(getattr(usage, 'completion_tokens', 0) or 0)
+
+    @staticmethod
+    def record_cache(cache, hit):
+        CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+    @staticmethod
+    def set_job_queue_depth(counts):
+        for status in ('pending', 'running', 'success', 'failed'):
+            JOB_QUEUE_DEPTH.labels(status).set(counts.get(status, 0))
+
+    @staticmethod
+    def mark_process_dead():
+        # 进程退出时清理多进程模式下该进程的livesum指标文件
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            multiprocess.mark_process_dead(os.getpid())
+
+    @staticmethod
+    def generate():
+        # 多个uvicorn worker时配置PROMETHEUS_MULTIPROC_DIR，汇总所有进程的指标
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), CONTENT_TYPE_LATEST
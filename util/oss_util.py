@@ -1,42 +1,86 @@
+import hashlib
 import os
+import threading
 import time
-from dotenv import load_dotenv
-import logging
-from io import BytesIO
-import requests
-from botocore.client import Config
-import boto3
+from collections import OrderedDict
 from datetime import datetime
 import random
-from PIL import Image
 from util.common_util import CommonUtil
+from util.env_util import load_env
+from util.log_util import get_logger
 
 
-# 设置日志记录
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(filename)s - %(funcName)s - %(lineno)d - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 
 class OSSUtil:
     def __init__(self):
-        load_dotenv()
+        load_env()
         self.S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
         self.S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID')
         self.S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY')
         self.S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
         self.S3_CUSTOM_DOMAIN = os.getenv('S3_CUSTOM_DOMAIN')
-        self.s3 = boto3.client(
-            's3',
-            endpoint_url=self.S3_ENDPOINT_URL,
-            aws_access_key_id=self.S3_ACCESS_KEY_ID,
-            aws_secret_access_key=self.S3_SECRET_ACCESS_KEY,
-            config=Config(signature_version='s3v4')  # 使用S3兼容签名版本
-        )
-
-    def get_default_file_key(self, url, is_thumbnail=False):
+        # S3客户端在第一次使用时创建，boto3导入与创建客户端较慢
+        self._s3 = None
+        self.s3_lock = threading.Lock()
+        # key生成方式：default按日期/url/时间戳生成；content按图片内容哈希生成，相同内容只上传一次
+        self.key_mode = os.getenv('OSS_KEY_MODE', 'default').lower()
+        # 已确认存在的对象key的本地索引（LRU），命中时无需HEAD请求
+        self.key_index_size = int(os.getenv('OSS_KEY_INDEX_SIZE', 100000))
+        self.key_index = OrderedDict()
+        self.key_index_lock = threading.Lock()
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            with self.s3_lock:
+                if self._s3 is None:
+                    import boto3
+                    from botocore.client import Config
+                    self._s3 = boto3.client(
+                        's3',
+                        endpoint_url=self.S3_ENDPOINT_URL,
+                        aws_access_key_id=self.S3_ACCESS_KEY_ID,
+                        aws_secret_access_key=self.S3_SECRET_ACCESS_KEY,
+                        config=Config(signature_version='s3v4')  # 使用S3兼容签名版本
+                    )
+        return self._s3
+
+    def get_screenshot_file_key(self, url, image_data, is_thumbnail=False, extension='png', suffix=None):
+        if self.key_mode == 'content':
+            return self.get_content_file_key(image_data, extension)
+        return self.get_default_file_key(url, is_thumbnail=is_thumbnail, extension=extension, suffix=suffix)
+
+    @staticmethod
+    def get_content_file_key(image_data, extension='png'):
+        digest = hashlib.sha256(image_data).hexdigest()
+        return f"screenshot_img/sha256/{digest[:2]}/{digest}.{extension}"
+
+    def remember_key(self, file_key):
+        with self.key_index_lock:
+            self.key_index[file_key] = True
+            self.key_index.move_to_end(file_key)
+            while len(self.key_index) > self.key_index_size:
+                self.key_index.popitem(last=False)
+
+    def object_exists(self, file_key):
+        # 先查本地索引，再用HEAD请求确认
+        with self.key_index_lock:
+            if file_key in self.key_index:
+                self.key_index.move_to_end(file_key)
+                return True
+        from botocore.exceptions import ClientError
+        try:
+            self.s3.head_object(Bucket=self.S3_BUCKET_NAME, Key=file_key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        self.remember_key(file_key)
+        return True
+
+    def get_default_file_key(self, url, is_thumbnail=False, extension='png', suffix=None):
         now = datetime.now()
         year = now.year
         month = now.month
@@ -50,69 +94,35 @@ class OSSUtil:
         # 如果is_thumbnail True，则添加"thumbnail-"前缀
         if is_thumbnail:
             image_name = f"{image_name}-thumbnail"
+        # 多尺寸缩略图等附加后缀
+        if suffix:
+            image_name = f"{image_name}-{suffix}"
 
         # 生成时间戳
         timestamp = int(time.time())
         # 构建默认的 file_key
-        return f"screenshot_img/{year}/{month}/{day}/{image_name}-{timestamp}.png"
+        return f"screenshot_img/{year}/{month}/{day}/{image_name}-{timestamp}.{extension}"
 
-    def upload_file_to_r2(self, file_path, file_key):
+    def upload_bytes_to_r2(self, image_data, file_key, content_type='image/png'):
+        # 直接上传内存中的数据，不经过本地文件
         try:
-            # 上传文件
-            if file_path and 'http' in file_path:
-                # 如果文件路径是URL
-                response = requests.get(file_path, headers={
-                    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-                    'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36'
-                })
-                image_data = response.content
-                self.s3.upload_fileobj(BytesIO(image_data), self.S3_BUCKET_NAME, file_key)
-            else:
-                self.s3.upload_file(file_path, self.S3_BUCKET_NAME, file_key)
-
-            logger.info(f"文件 '{file_path}' 成功上传到 '{self.S3_BUCKET_NAME}/{file_key}'")
-            if os.path.exists(file_path):
-                os.remove(file_path)
-
-            # 如果提供了自定义域名
-            if self.S3_CUSTOM_DOMAIN:
-                file_url = f"https://{self.S3_CUSTOM_DOMAIN}/{file_key}"
+            if self.key_mode == 'content' and self.object_exists(file_key):
+                # 内容寻址：相同内容的对象已存在，跳过上传
+                logger.info(f"文件已存在，跳过上传: '{self.S3_BUCKET_NAME}/{file_key}'")
             else:
-                file_url = f"{self.S3_ENDPOINT_URL}/{self.S3_BUCKET_NAME}/{file_key}"
-
+                self.s3.put_object(Bucket=self.S3_BUCKET_NAME, Key=file_key, Body=image_data,
+                                   ContentType=content_type)
+                self.remember_key(file_key)
+                logger.info(f"文件成功上传到 '{self.S3_BUCKET_NAME}/{file_key}'")
+            file_url = self.get_file_url(file_key)
             logger.info(f"文件URL: {file_url}")
             return file_url
         except Exception as e:
             logger.info(f"上传文件过程中发生错误: {e}")
             return None
 
-    def generate_thumbnail_image(self, url, image_key):
-        # 下载图像文件
-        response = self.s3.get_object(Bucket=self.S3_BUCKET_NAME, Key=image_key)
-        image_data = response['Body'].read()
-
-        # 使用Pillow库打开图像
-        image = Image.open(BytesIO(image_data))
-
-        # 将图像缩放为50%
-        width, height = image.size
-        new_width = int(width * 0.5)
-        new_height = int(height * 0.5)
-        resized_image = image.resize((new_width, new_height))
-
-        # 创建一个BytesIO对象来保存缩略图
-        thumbnail_buffer = BytesIO()
-        resized_image.save(thumbnail_buffer, format='PNG')
-        thumbnail_buffer.seek(0)
-
-        # 将缩略图上传回S3
-        thumbnail_key = self.get_default_file_key(url, is_thumbnail=True)
-        self.s3.put_object(Bucket=self.S3_BUCKET_NAME, Key=thumbnail_key, Body=thumbnail_buffer)
-
+    def get_file_url(self, file_key):
         # 如果提供了自定义域名
         if self.S3_CUSTOM_DOMAIN:
-            file_url = f"https://{self.S3_CUSTOM_DOMAIN}/{thumbnail_key}"
-        else:
-            file_url = f"{self.S3_ENDPOINT_URL}/{self.S3_BUCKET_NAME}/{thumbnail_key}"
-        logger.info(f"缩略图文件URL: {file_url}")
-        return file_url
+            return f"https://{self.S3_CUSTOM_DOMAIN}/{file_key}"
+        return f"{self.S3_ENDPOINT_URL}/{self.S3_BUCKET_NAME}/{file_key}"
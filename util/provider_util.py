@@ -0,0 +1,424 @@
+import asyncio
+import inspect
+import json
+import os
+import random
+import re
+import time
+
+from util.env_util import load_env
+from util.log_util import get_logger
+from util.metrics_util import LLM_PROVIDER_REQUESTS
+
+logger = get_logger(__name__)
+
+DEFAULT_OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# 可以换一个后端重试的HTTP状态码：限流、鉴权失败（单个key失效）、超时、冲突与5xx
+RETRY_STATUS = {401, 403, 408, 409, 429}
+
+
+def api_errors():
+    # 可以换一个后端重试的SDK异常（连接失败/超时，以及带状态码的接口错误）；openai/groq导入较慢，用到时才导入
+    import groq
+    import openai
+    return (openai.APIConnectionError, groq.APIConnectionError, openai.APIStatusError, groq.APIStatusError)
+
+
+class ProviderUnavailable(Exception):
+    """
+    所有LLM后端都处于熔断状态，或在最长等待时间内没有可用额度
+    """
+
+
+def parse_reset(value):
+    # 解析限流重置时间，返回距离现在的秒数
+    # 兼容 "1m30.5s"/"250ms"/"2h" 形式的时长、秒数，以及秒或毫秒级的时间戳（OpenRouter）
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        number = float(value)
+    except ValueError:
+        parts = re.findall(r'([\d.]+)\s*(ms|h|m|s)', value)
+        if not parts:
+            return None
+        units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+        return sum(float(amount) * units[unit] for amount, unit in parts)
+    if number > 1e12:
+        return max(number / 1000 - time.time(), 0)
+    if number > 1e9:
+        return max(number - time.time(), 0)
+    return max(number, 0)
+
+
+def parse_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateBucket:
+    """
+    令牌桶：per_minute为本地配置的每分钟额度（0表示不限制），按速率持续补充；
+    同时记录响应头中服务端告知的剩余额度与重置时间，剩余额度不足时等到重置后再发请求
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+        # 服务端告知的剩余额度，None表示未知
+        self.remaining = None
+        self.reset_at = 0
+        # 429之后暂停到该时间
+        self.blocked_until = 0
+
+    def refill(self, now):
+        if self.capacity > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.remaining is not None and now >= self.reset_at:
+            # 服务端额度已重置，等待下一次响应头同步
+            self.remaining = None
+
+    def wait_time(self, amount, now):
+        self.refill(now)
+        wait = max(self.blocked_until - now, 0)
+        if self.capacity > 0 and self.tokens < min(amount, self.capacity):
+            wait = max(wait, (min(amount, self.capacity) - self.tokens) / self.rate)
+        if self.remaining is not None and self.remaining < amount:
+            wait = max(wait, self.reset_at - now)
+        return wait
+
+    def take(self, amount):
+        if self.capacity > 0:
+            self.tokens -= amount
+        if self.remaining is not None:
+            # 并发中的请求也会消耗服务端额度
+            self.remaining -= amount
+
+    def sync(self, remaining, reset, now):
+        if remaining is None:
+            return
+        self.remaining = remaining
+        self.reset_at = now + (reset if reset is not None else 1)
+        if self.capacity > 0:
+            self.tokens = min(self.tokens, remaining)
+
+    def block(self, seconds, now):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后打开，冷却期内不再分配请求；冷却后半开放行一个试探请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_until = 0
+        self.trial_running = False
+
+    def available(self, now):
+        if self.state == 'closed':
+            return True
+        if self.state == 'open':
+            return now >= self.opened_until
+        return not self.trial_running
+
+    def begin(self, now):
+        if self.state == 'open' and now >= self.opened_until:
+            self.state = 'half_open'
+        if self.state == 'half_open':
+            self.trial_running = True
+
+    def success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.trial_running = False
+
+    def failure(self, now):
+        self.failures += 1
+        self.trial_running = False
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            self.state = 'open'
+            self.opened_until = now + self.cooldown
+
+    def abort(self):
+        # 请求未得出健康结论（如被限流），释放半开状态的试探名额
+        self.trial_running = False
+
+
+class LLMProvider:
+    """
+    单个LLM后端（一个key + 一个模型），带请求数/token数两个令牌桶与熔断器
+    """
+
+    def __init__(self, name, source, api_key, model, base_url=None, weight=1.0, rpm=0, tpm=0,
+                 failure_threshold=3, cooldown=30):
+        self.name = name
+        self.source = source
+        self.model = model
+        self.weight = weight
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        self.requests = RateBucket(rpm)
+        self.tokens = RateBucket(tpm)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.inflight = 0
+        self.counts = {'success': 0, 'rate_limited': 0, 'error': 0}
+
+    @property
+    def client(self):
+        # 第一次调用时才创建客户端
+        if self._client is None:
+            self._client = self.create_client(self.source, self.api_key, self.base_url)
+        return self._client
+
+    @staticmethod
+    def create_client(source, api_key, base_url):
+        # 重试由连接池统一处理，关闭SDK自带的重试
+        if source == 'groq':
+            from groq import AsyncGroq
+            return AsyncGroq(api_key=api_key, base_url=base_url or None, max_retries=0)
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=api_key, base_url=base_url or DEFAULT_OPENROUTER_BASE_URL, max_retries=0)
+
+    async def warm_up(self):
+        # 创建客户端并建立连接（models接口不消耗额度），失败不影响后续调用
+        try:
+            await self.client.models.list()
+        except Exception as e:
+            logger.warning(f"LLM后端{self.name}预热连接失败: {e}")
+
+    def available(self, now):
+        return self.breaker.available(now)
+
+    def wait_time(self, estimated_tokens, now):
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(estimated_tokens, now))
+
+    def begin(self, estimated_tokens, now):
+        self.breaker.begin(now)
+        self.requests.take(1)
+        self.tokens.take(estimated_tokens)
+        self.inflight += 1
+
+    def sync(self, headers):
+        # 按响应头同步服务端剩余额度（OpenAI/Groq风格的-requests/-tokens后缀，OpenRouter不带后缀）
+        if not headers:
+            return
+        now = time.monotonic()
+        self.requests.sync(parse_int(headers.get('x-ratelimit-remaining-requests', headers.get('x-ratelimit-remaining'))),
+                           parse_reset(headers.get('x-ratelimit-reset-requests', headers.get('x-ratelimit-reset'))),
+                           now)
+        self.tokens.sync(parse_int(headers.get('x-ratelimit-remaining-tokens')),
+                         parse_reset(headers.get('x-ratelimit-reset-tokens')), now)
+
+    def rate_limited(self, headers, backoff):
+        now = time.monotonic()
+        self.sync(headers)
+        retry_after = None
+        if headers:
+            retry_after = parse_reset(headers.get('retry-after-ms'))
+            retry_after = retry_after / 1000 if retry_after is not None else parse_reset(headers.get('retry-after'))
+        self.requests.block(retry_after if retry_after is not None else backoff, now)
+        self.breaker.abort()
+        self.record('rate_limited')
+
+    def record(self, status):
+        self.counts[status] += 1
+        LLM_PROVIDER_REQUESTS.labels(self.name, status).inc()
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'name': self.name,
+            'model': self.model,
+            'weight': self.weight,
+            'state': self.breaker.state,
+            'inflight': self.inflight,
+            'wait_seconds': round(self.wait_time(1, now), 3),
+            'remaining_requests': self.requests.remaining,
+            'remaining_tokens': self.tokens.remaining,
+            **self.counts,
+        }
+
+
+class ProviderPool:
+    """
+    LLM后端池：
+    - LLM_PROVIDERS配置多个key/后端（JSON数组），未配置时按API_SOURCE读取原有配置，key可用逗号分隔配置多个
+    - 按权重与当前并发数选择有额度的后端，额度来自本地rpm/tpm配置与响应头中的限流信息
+    - 429/5xx/连接失败时换一个后端重试（指数退避），连续失败的后端熔断一段时间
+    """
+
+    def __init__(self):
+        load_env()
+        self.max_attempts = int(os.getenv('LLM_MAX_ATTEMPTS', 4))
+        self.retry_backoff = float(os.getenv('LLM_RETRY_BACKOFF', 1))
+        self.max_wait = float(os.getenv('LLM_MAX_WAIT', 60))
+        self.providers = self.load_providers()
+        if not self.providers:
+            logger.warning("未配置LLM后端")
+        for provider in self.providers:
+            logger.info(f"LLM后端:{provider.name}, 模型:{provider.model}, 权重:{provider.weight}")
+
+    @staticmethod
+    def load_providers():
+        failure_threshold = int(os.getenv('LLM_BREAKER_FAILURES', 3))
+        cooldown = float(os.getenv('LLM_BREAKER_COOLDOWN', 30))
+        configs = []
+        if os.getenv('LLM_PROVIDERS'):
+            try:
+                configs = json.loads(os.getenv('LLM_PROVIDERS'))
+            except ValueError as e:
+                logger.error(f"LLM_PROVIDERS不是合法JSON: {e}")
+        else:
+            source = os.getenv('API_SOURCE')
+            prefix = 'OPENROUTER' if source == 'openrouter' else 'GROQ' if source == 'groq' else None
+            if prefix:
+                for api_key in (os.getenv(f'{prefix}_API_KEY') or '').split(','):
+                    configs.append({'source': source, 'api_key': api_key.strip(),
+                                    'model': os.getenv(f'{prefix}_MODEL'),
+                                    'base_url': os.getenv(f'{prefix}_BASE_URL'),
+                                    'rpm': int(os.getenv(f'{prefix}_RPM', 0)),
+                                    'tpm': int(os.getenv(f'{prefix}_TPM', 0))})
+
+        providers = []
+        for index, config in enumerate(configs):
+            if not config.get('api_key'):
+                continue
+            source = config.get('source', 'openrouter')
+            providers.append(LLMProvider(config.get('name') or f"{source}-{index}", source, config['api_key'],
+                                         config.get('model'), config.get('base_url'),
+                                         float(config.get('weight', 1)), int(config.get('rpm', 0)),
+                                         int(config.get('tpm', 0)), failure_threshold, cooldown))
+        return providers
+
+    @property
+    def model(self):
+        # 主模型名，用于日志
+        return self.providers[0].model if self.providers else None
+
+    @property
+    def models(self):
+        # 池中所有模型（去重排序），用于结果缓存key：任一后端都可能响应，调整后端顺序不影响缓存
+        return sorted({provider.model for provider in self.providers if provider.model})
+
+    async def acquire(self, estimated_tokens, exclude):
+        # 选择一个有额度的后端，都没有额度时等待最早恢复的后端；没有可用后端时返回None
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            now = time.monotonic()
+            candidates = [provider for provider in self.providers
+                          if provider not in exclude and provider.available(now)]
+            if not candidates:
+                return None
+            waits = {provider: provider.wait_time(estimated_tokens, now) for provider in candidates}
+            ready = [provider for provider in candidates if waits[provider] <= 0]
+            if ready:
+                # 加权随机，并发越多的后端权重越低
+                provider = random.choices(ready, weights=[p.weight / (p.inflight + 1) for p in ready])[0]
+                provider.begin(estimated_tokens, now)
+                return provider
+            wait = min(waits.values())
+            if now + wait > deadline:
+                return None
+            await asyncio.sleep(min(wait, 1))
+
+    async def complete(self, request, on_delta=None):
+        # 调用chat completion，返回 (文本, usage, 实际响应的模型)；on_delta不为空时流式调用，已输出内容后失败不再重试
+        estimated_tokens = sum(len(message.get('content') or '') for message in request.get('messages', [])) // 4
+        state = {'streamed': False}
+        tried = set()
+        last_error = None
+        attempt = 0
+        while attempt < self.max_attempts:
+            provider = await self.acquire(estimated_tokens, tried)
+            if provider is None:
+                if not tried:
+                    break
+                # 所有后端都试过一遍，退避后重新选择
+                tried.clear()
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                continue
+            attempt += 1
+            try:
+                content, usage = await self.call(provider, request, on_delta, state)
+                provider.breaker.success()
+                provider.record('success')
+                if usage and getattr(usage, 'total_tokens', None):
+                    # 按实际用量修正token桶
+                    provider.tokens.take(usage.total_tokens - estimated_tokens)
+                return content, usage, provider.model
+            except api_errors() as e:
+                last_error = e
+                status = getattr(e, 'status_code', None)
+                response = getattr(e, 'response', None)
+                headers = response.headers if response is not None else None
+                if status == 429:
+                    logger.warning(f"LLM后端{provider.name}被限流，切换后端重试")
+                    provider.rate_limited(headers, self.retry_backoff * 2 ** (attempt - 1))
+                elif status is None or status >= 500 or status in RETRY_STATUS:
+                    logger.warning(f"LLM后端{provider.name}调用失败({status or type(e).__name__})，切换后端重试")
+                    provider.breaker.failure(time.monotonic())
+                    provider.record('error')
+                else:
+                    provider.breaker.abort()
+                    provider.record('error')
+                    raise
+                if state['streamed']:
+                    raise
+                tried.add(provider)
+            except BaseException:
+                provider.breaker.abort()
+                raise
+            finally:
+                provider.inflight -= 1
+        if last_error:
+            raise last_error
+        raise ProviderUnavailable("no available llm provider")
+
+    @staticmethod
+    async def parse(raw):
+        # openai的with_raw_response返回同步parse，groq部分版本为异步parse
+        result = raw.parse()
+        return await result if inspect.isawaitable(result) else result
+
+    @staticmethod
+    async def call(provider, request, on_delta, state):
+        request = dict(request, model=provider.model)
+        if not on_delta:
+            raw = await provider.client.chat.completions.with_raw_response.create(**request)
+            provider.sync(raw.headers)
+            chat_completion = await ProviderPool.parse(raw)
+            message = chat_completion.choices[0].message if chat_completion.choices else None
+            return message.content if message else None, getattr(chat_completion, 'usage', None)
+
+        raw = await provider.client.chat.completions.with_raw_response.create(stream=True, **request)
+        provider.sync(raw.headers)
+        stream = await ProviderPool.parse(raw)
+        parts = []
+        usage = None
+        async for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            delta = chunk.choices[0].delta if chunk.choices else None
+            if delta and delta.content:
+                parts.append(delta.content)
+                state['streamed'] = True
+                await on_delta(delta.content)
+        return ''.join(parts), usage
+
+    async def warm_up(self):
+        await asyncio.gather(*[provider.warm_up() for provider in self.providers])
+
+    def stats(self):
+        return [provider.stats() for provider in self.providers]
@@ -0,0 +1,174 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+import tldextract
+
+from util.common_util import CommonUtil
+from util.env_util import load_env
+from util.log_util import get_logger
+from util.metrics_util import SCHEDULER_REJECTED, SCHEDULER_RUNNING, SCHEDULER_WAITING
+
+logger = get_logger(__name__)
+
+# 优先级，数值越小越先执行
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BACKGROUND: 'background'}
+
+# 使用tldextract内置的公共后缀列表（不联网更新），包含github.io等私有后缀，不同用户的子域名分别计数
+DOMAIN_EXTRACTOR = tldextract.TLDExtract(suffix_list_urls=(), include_psl_private_domains=True)
+
+
+class AdmissionRejected(Exception):
+    """
+    调度器队列已满或排队超时，调用方应返回429，retry_after为建议的重试等待秒数
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"too many requests, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class CrawlScheduler:
+    """
+    爬取准入控制：
+    - 全局并发上限与单域名并发上限，超出的请求进入等待队列；只有交互请求受队列长度上限限制
+    - 队列按优先级出队，交互请求（/site/crawl）先于后台任务；域名已满的请求不阻塞其他域名
+    - 交互请求在队列已满或排队超时时立即拒绝，返回根据平均耗时估算的Retry-After；后台任务一直等待
+    """
+
+    def __init__(self):
+        load_env()
+        self.enabled = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+        self.max_concurrency = int(os.getenv('SCHEDULER_MAX_CONCURRENCY', 8))
+        self.max_per_domain = int(os.getenv('SCHEDULER_MAX_PER_DOMAIN', 2))
+        self.max_queue = int(os.getenv('SCHEDULER_MAX_QUEUE', 50))
+        self.queue_timeout = float(os.getenv('SCHEDULER_QUEUE_TIMEOUT', 120))
+        self.running = 0
+        self.domains = {}
+        # 等待队列：(优先级, 序号, 域名, future)
+        self.waiting = []
+        # 等待中的交互请求数，后台任务不占用SCHEDULER_MAX_QUEUE，不会导致交互请求被拒绝
+        self.interactive_waiting = 0
+        self.sequence = 0
+        # 单次爬取平均耗时（指数移动平均），用于估算Retry-After
+        self.average_seconds = 30.0
+        logger.info(f"调度器全局并发: {self.max_concurrency}, 单域名并发: {self.max_per_domain}, "
+                    f"等待队列: {self.max_queue}")
+
+    @staticmethod
+    def get_domain(url):
+        # 按可注册域名（eTLD+1）计数，a.example.com与b.example.com共享并发上限；IP、localhost等按host计数
+        normalized = CommonUtil.normalize_url(url)
+        host = normalized.split('/')[0] if normalized else ''
+        extracted = DOMAIN_EXTRACTOR(host)
+        if extracted.domain and extracted.suffix:
+            return f"{extracted.domain}.{extracted.suffix}"
+        return host
+
+    def can_run(self, domain):
+        return self.running < self.max_concurrency and self.domains.get(domain, 0) < self.max_per_domain
+
+    def start(self, domain):
+        self.running += 1
+        self.domains[domain] = self.domains.get(domain, 0) + 1
+        SCHEDULER_RUNNING.inc()
+
+    def release(self, domain):
+        self.running -= 1
+        self.domains[domain] -= 1
+        if self.domains[domain] <= 0:
+            del self.domains[domain]
+        SCHEDULER_RUNNING.dec()
+        self.dispatch()
+
+    def dispatch(self):
+        # 按优先级和到达顺序唤醒可以执行的请求，域名已满的请求跳过，不阻塞后面的其他域名
+        self.waiting.sort(key=lambda item: item[:2])
+        for item in list(self.waiting):
+            if self.running >= self.max_concurrency:
+                break
+            priority, _, domain, future = item
+            if future.done() or not self.can_run(domain):
+                continue
+            self.remove_waiting(item)
+            self.start(domain)
+            future.set_result(True)
+
+    def add_waiting(self, item):
+        self.waiting.append(item)
+        if item[0] == PRIORITY_INTERACTIVE:
+            self.interactive_waiting += 1
+        SCHEDULER_WAITING.labels(PRIORITY_NAMES[item[0]]).inc()
+
+    def remove_waiting(self, item):
+        if item in self.waiting:
+            self.waiting.remove(item)
+            if item[0] == PRIORITY_INTERACTIVE:
+                self.interactive_waiting -= 1
+            SCHEDULER_WAITING.labels(PRIORITY_NAMES[item[0]]).dec()
+
+    def retry_after(self):
+        # 估算排在前面的交互请求执行完所需时间（后台任务优先级更低，不影响交互请求）
+        seconds = self.average_seconds * (self.interactive_waiting + 1) / self.max_concurrency
+        return max(1, min(300, math.ceil(seconds)))
+
+    def is_full(self):
+        return self.enabled and self.interactive_waiting >= self.max_queue and self.running >= self.max_concurrency
+
+    async def acquire(self, domain, priority):
+        if self.can_run(domain):
+            self.start(domain)
+            return
+        interactive = priority == PRIORITY_INTERACTIVE
+        if interactive and self.interactive_waiting >= self.max_queue:
+            SCHEDULER_REJECTED.inc()
+            raise AdmissionRejected(self.retry_after())
+
+        self.sequence += 1
+        future = asyncio.get_running_loop().create_future()
+        item = (priority, self.sequence, domain, future)
+        self.add_waiting(item)
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout if interactive else None)
+        except asyncio.TimeoutError:
+            self.remove_waiting(item)
+            SCHEDULER_REJECTED.inc()
+            raise AdmissionRejected(self.retry_after())
+        except BaseException:
+            # 请求被取消（如客户端断开）：已分配到执行名额时归还，否则移出队列
+            if future.done() and not future.cancelled():
+                self.release(domain)
+            else:
+                self.remove_waiting(item)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, url, priority=PRIORITY_INTERACTIVE):
+        # 获取执行名额，退出时归还并唤醒等待中的请求
+        if not self.enabled:
+            yield
+            return
+        domain = self.get_domain(url)
+        await self.acquire(domain, priority)
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.average_seconds = self.average_seconds * 0.8 + (time.time() - start_time) * 0.2
+            self.release(domain)
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'waiting': len(self.waiting),
+            'interactive_waiting': self.interactive_waiting,
+            'max_concurrency': self.max_concurrency,
+            'max_per_domain': self.max_per_domain,
+            'max_queue': self.max_queue,
+            'domains': dict(self.domains),
+            'average_seconds': round(self.average_seconds, 2),
+        }
@@ -0,0 +1,108 @@
+import os
+import threading
+
+from util.env_util import load_env
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+# 已加载的tokenizer实例缓存，key为(类型, 名称)
+_tokenizers = {}
+_tokenizer_lock = threading.Lock()
+
+
+class HFTokenizer:
+    # transformers tokenizer适配（llama / fast）
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def encode(self, text):
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def decode(self, tokens):
+        return self.tokenizer.decode(tokens, skip_special_tokens=True)
+
+
+class SentencePieceTokenizer:
+    # 本地sentencepiece词表文件适配
+    def __init__(self, model_file):
+        import sentencepiece
+        self.processor = sentencepiece.SentencePieceProcessor(model_file=model_file)
+
+    def encode(self, text):
+        return self.processor.encode(text)
+
+    def decode(self, tokens):
+        return self.processor.decode(tokens)
+
+
+def load_tokenizer(tokenizer_type, tokenizer_name):
+    # 懒加载并缓存tokenizer，同一(类型, 名称)只加载一次
+    cache_key = (tokenizer_type, tokenizer_name)
+    tokenizer = _tokenizers.get(cache_key)
+    if tokenizer is not None:
+        return tokenizer
+    with _tokenizer_lock:
+        tokenizer = _tokenizers.get(cache_key)
+        if tokenizer is not None:
+            return tokenizer
+        logger.info(f"正在加载tokenizer: {tokenizer_type} {tokenizer_name}")
+        if tokenizer_type == 'llama':
+            from transformers import LlamaTokenizer
+            tokenizer = HFTokenizer(LlamaTokenizer.from_pretrained(tokenizer_name))
+        elif tokenizer_type == 'fast':
+            from transformers import AutoTokenizer
+            tokenizer = HFTokenizer(AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True))
+        elif tokenizer_type == 'sentencepiece':
+            tokenizer = SentencePieceTokenizer(tokenizer_name)
+        else:
+            raise ValueError(f"不支持的tokenizer类型: {tokenizer_type}")
+        _tokenizers[cache_key] = tokenizer
+        return tokenizer
+
+
+class TokenUtil:
+    """
+    按token预算截取文本：
+    1. utf-8字节数不超过预算时，token数必然不超过预算，直接返回，无需分词
+    2. 按每token最大字符数预先截取前缀，只对有界前缀分词
+    3. tokenizer_type为estimate时，只按平均字符数估算截取，不加载tokenizer
+    """
+
+    def __init__(self):
+        load_env()
+        # llama / fast / sentencepiece / estimate
+        self.tokenizer_type = os.getenv('TOKENIZER_TYPE', 'llama')
+        # 模型名称、本地目录，或sentencepiece词表文件路径
+        self.tokenizer_name = os.getenv('TOKENIZER_NAME', 'huggyllama/llama-65b')
+        # 每个token的平均字符数（estimate模式使用）与最大字符数（预截取使用）
+        self.chars_per_token = float(os.getenv('TOKENIZER_CHARS_PER_TOKEN', 4))
+        self.max_chars_per_token = float(os.getenv('TOKENIZER_MAX_CHARS_PER_TOKEN', 10))
+
+    def get_tokenizer(self):
+        return load_tokenizer(self.tokenizer_type, self.tokenizer_name)
+
+    def truncate(self, text, max_tokens):
+        if not text or len(text.encode('utf-8')) <= max_tokens:
+            return text
+
+        if self.tokenizer_type == 'estimate':
+            max_chars = int(max_tokens * self.chars_per_token)
+            if len(text) > max_chars:
+                logger.info(f"用户输入长度超过{max_tokens}（估算），进行截取")
+                return text[:max_chars]
+            return text
+
+        # 预截取：前缀长度足以包含max_tokens个token，避免对超大文本整体分词
+        prefix = text[:int(max_tokens * self.max_chars_per_token)]
+        tokenizer = self.get_tokenizer()
+        tokens = tokenizer.encode(prefix)
+        if len(tokens) > max_tokens:
+            logger.info(f"用户输入长度超过{max_tokens}，进行截取")
+            return tokenizer.decode(tokens[:max_tokens])
+        return prefix
+
+    def warm_up(self):
+        # 预先加载tokenizer
+        if self.tokenizer_type != 'estimate':
+            self.get_tokenizer()
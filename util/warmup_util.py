@@ -0,0 +1,66 @@
+import asyncio
+import os
+import time
+
+from util.env_util import load_env
+from util.log_util import get_logger
+
+logger = get_logger(__name__)
+
+
+class WarmupUtil:
+    """
+    启动后在后台预热各组件（tokenizer、客户端与连接池、浏览器），不阻塞服务启动；
+    WARMUP_COMPONENTS指定需要预热的组件，全部完成（成功或失败）后就绪接口返回ready
+    """
+
+    def __init__(self):
+        load_env()
+        self.enabled = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+        self.components = [name.strip() for name in os.getenv('WARMUP_COMPONENTS', 'clients,tokenizer,http').split(',')
+                           if name.strip()]
+        self.timeout = float(os.getenv('WARMUP_TIMEOUT', 120))
+        # 组件名 → 预热函数（异步，无参数）
+        self.tasks = {}
+        # 组件名 → {'status': pending/ready/failed, 'seconds': 耗时, 'error': 失败原因}
+        self.status = {}
+        self.task = None
+
+    def register(self, name, warm_up):
+        if self.enabled and name in self.components:
+            self.tasks[name] = warm_up
+            self.status[name] = {'status': 'pending'}
+
+    def start(self):
+        if self.tasks:
+            logger.info(f"后台预热组件: {list(self.tasks)}")
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        await asyncio.gather(*[self.run_one(name, warm_up) for name, warm_up in self.tasks.items()])
+        logger.info(f"预热完成: {self.status}")
+
+    async def run_one(self, name, warm_up):
+        start_time = time.time()
+        try:
+            await asyncio.wait_for(warm_up(), timeout=self.timeout)
+            self.status[name] = {'status': 'ready', 'seconds': round(time.time() - start_time, 3)}
+        except Exception as e:
+            # 预热失败不影响服务，第一次使用时仍会按需加载
+            logger.warning(f"预热{name}失败: {e}")
+            self.status[name] = {'status': 'failed', 'seconds': round(time.time() - start_time, 3),
+                                 'error': str(e) or type(e).__name__}
+
+    def is_ready(self):
+        return all(item['status'] != 'pending' for item in self.status.values())
+
+    def snapshot(self):
+        return {'ready': self.is_ready(), 'components': self.status}
+
+    async def close(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
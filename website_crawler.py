@@ -1,27 +1,29 @@
-from bs4 import BeautifulSoup
-import logging
+import asyncio
 import time
 import random
 import os
-import base64
-import requests
-from pyppeteer import launch
+import threading
 
+from util.browser_util import BrowserPool, PageLoader
 from util.common_util import CommonUtil
+from util.executor_util import ExecutorUtil
+from util.extract_util import ExtractUtil
+from util.fetch_stats_util import FetchStats
+from util.fingerprint_util import FingerprintStore, content_hash
+from util.http_util import HttpUtil
+from util.log_util import get_logger
+from util.metrics_util import MetricsUtil
+from util.image_util import ImageUtil
 from util.llm_util import LLMUtil
 from util.oss_util import OSSUtil
-from firecrawl import FirecrawlApp
 
 
 llm = LLMUtil()
 oss = OSSUtil()
+image_util = ImageUtil()
+extract_util = ExtractUtil()
 
-# 设置日志记录
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(filename)s - %(funcName)s - %(lineno)d - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 global_agent_headers = [
     "Mozilla/5.0 (Windows NT 6.3; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36",
@@ -40,258 +42,473 @@ global_agent_headers = [
 
 class WebsitCrawler:
     def __init__(self):
-        self.browser = None
-        self.firecrawl_app = FirecrawlApp(api_key=os.getenv('FIRECRAWL_API_KEY'))
-
-    
-    async def scrape_website_by_firecrawl(self, url, tags, languages):
-        # 开始爬虫处理
-        try: 
-            # 记录程序开始时间
-            start_time = int(time.time())
-            logger.info("正在处理：" + url)
-            logger.info("使用firecrawl服务")
-            if not url.startswith('http://') and not url.startswith('https://'):
-                url = 'https://' + url
-
-            # 使用firecrawl爬取网页内容，包括截图
-            scrape_result = self.firecrawl_app.scrape_url(
-                url, 
+        self.browser_pool = BrowserPool()
+        self.page_loader = PageLoader()
+        # firecrawl客户端在第一次使用时创建，firecrawl导入较慢
+        self._firecrawl_app = None
+        self.firecrawl_lock = threading.Lock()
+        # 对冲模式：firecrawl超过指定时间未返回时，并行启动浏览器爬取，取先返回的有效结果
+        self.hedge_enabled = os.getenv('FETCH_HEDGE_ENABLED', 'false').lower() == 'true'
+        self.hedge_delay = float(os.getenv('FETCH_HEDGE_DELAY', 20))
+        self.fetch_stats = FetchStats()
+        # 增量爬取使用的站点指纹
+        self.fingerprints = FingerprintStore()
+
+    @property
+    def firecrawl_app(self):
+        if self._firecrawl_app is None:
+            with self.firecrawl_lock:
+                if self._firecrawl_app is None:
+                    from firecrawl import FirecrawlApp
+                    self._firecrawl_app = FirecrawlApp(api_key=os.getenv('FIRECRAWL_API_KEY'),
+                                                       api_url=os.getenv('FIRECRAWL_API_URL',
+                                                                         'https://api.firecrawl.dev'))
+        return self._firecrawl_app
+
+    def create_clients(self):
+        # 预先创建firecrawl与S3客户端（同步阻塞，在线程池中执行）
+        return self.firecrawl_app, oss.s3
+
+    async def upload_screenshot(self, url, screenshot_data):
+        # 截图只解码一次，编码截图并生成多尺寸缩略图，然后并行上传
+        with MetricsUtil.stage('thumbnail'):
+            screenshot, thumbnails = await ExecutorUtil.run(image_util.process_screenshot, screenshot_data)
+
+        uploads = [ExecutorUtil.run(oss.upload_bytes_to_r2, screenshot.data,
+                                    oss.get_screenshot_file_key(url, screenshot.data, extension=screenshot.extension),
+                                    screenshot.content_type)]
+        for index, thumbnail in enumerate(thumbnails):
+            # 第一个缩略图沿用原有key格式，其余尺寸追加宽高后缀
+            suffix = f"{thumbnail.width}x{thumbnail.height}" if index > 0 else None
+            uploads.append(ExecutorUtil.run(oss.upload_bytes_to_r2, thumbnail.data,
+                                            oss.get_screenshot_file_key(url, thumbnail.data, is_thumbnail=True,
+                                                                        extension=thumbnail.extension,
+                                                                        suffix=suffix),
+                                            thumbnail.content_type))
+        with MetricsUtil.stage('upload'):
+            urls = await asyncio.gather(*uploads)
+
+        screenshot_key = urls[0]
+        thumbnail_list = [{'width': thumbnail.width, 'height': thumbnail.height, 'url': thumbnail_url}
+                          for thumbnail, thumbnail_url in zip(thumbnails, urls[1:])]
+        thumbnail_key = thumbnail_list[0]['url'] if thumbnail_list else None
+        return screenshot_key, thumbnail_key, thumbnail_list
+
+    async def fetch_by_firecrawl(self, url):
+        # 使用firecrawl爬取网页内容，包括截图；返回页面数据，失败返回None
+        logger.info("使用firecrawl服务")
+
+        # 使用firecrawl爬取网页内容，包括截图；firecrawl客户端为同步阻塞调用，放到线程池中执行
+        with MetricsUtil.stage('fetch_firecrawl'):
+            scrape_result = await ExecutorUtil.run(
+                self.firecrawl_app.scrape_url,
+                url,
                 formats=['markdown'],
                 actions=[{"type": "screenshot"}],
                 timeout=120000  # 设置超时时间为120秒（120000毫秒）
             )
-            logger.info(f"Firecrawl 返回结果类型: {type(scrape_result)}")
-
-            if scrape_result.success:
-                logger.info(f"Firecrawl 结果: {scrape_result.success}")
-                # 转为字典
-                result_dict = scrape_result.model_dump()
-
-                # 获取markdown内容
-                markdown = result_dict.get("markdown")
-
-                # metadata
-                metadata = result_dict.get("metadata")
-                if not metadata or not metadata:
-                    logger.error(f"Firecrawl 未返回metadata/markdown: {scrape_result}")
-                    return None;
-        
-                # 从 metadata中获取title和description
-                title = metadata.get("title")
-                description = metadata.get("description")
-                if not title or not description:
-                    logger.error(f"Firecrawl 未返回title/description: {scrape_result}")
-                    return None;
-                
-            else:
-                logger.error(f"Firecrawl 爬取失败: {scrape_result}")
-                return None;
-                
-            
-            # 使用firecrawl返回的title作为name
-            name = title
-
-            logger.info(f"url:{url}, title:{title}, description:{description}")
-
-            # 处理firecrawl返回的截图
-            screenshot_key = None
-            thumnbail_key = None
-            
-            # 从firecrawl结果中获取截图URL
-            actions = result_dict.get('actions', {})
-            screenshots = actions.get('screenshots', []) if actions else []
-            
-            logger.info(f"截图信息 - actions: {actions}, screenshots: {screenshots}")
-            
-            if screenshots and len(screenshots) > 0:
-                try:
-                    # 获取第一个截图URL
-                    screenshot_url = screenshots[0]
-                    logger.info(f"获取到firecrawl截图URL: {screenshot_url}")
-                    
-                    # 生成文件key
-                    image_key = oss.get_default_file_key(url)
-                    
-                    # 下载截图文件
-                    response = requests.get(screenshot_url)
-                    response.raise_for_status()
-                    
-                    # 保存到临时文件
-                    screenshot_path = './' + url.replace("https://", "").replace("http://", "").replace("/", "").replace(".", "-") + '.png'
-                    with open(screenshot_path, 'wb') as f:
-                        f.write(response.content)
-                    
-                    # 上传图片，返回图片地址
-                    screenshot_key = oss.upload_file_to_r2(screenshot_path, image_key)
-                    # 生成缩略图
-                    thumnbail_key = oss.generate_thumbnail_image(url, image_key)
-                    
-                    logger.info(f"使用firecrawl截图成功: {screenshot_key}")
-                    
-                except Exception as screenshot_error:
-                    logger.warning(f"处理firecrawl截图失败: {screenshot_error}")
-            else:
-                logger.warning("firecrawl未返回截图数据")
+        logger.info(f"Firecrawl 返回结果类型: {type(scrape_result)}")
+
+        if scrape_result.success:
+            logger.info(f"Firecrawl 结果: {scrape_result.success}")
+            # 转为字典
+            result_dict = scrape_result.model_dump()
+
+            # 获取markdown内容
+            markdown = result_dict.get("markdown")
+
+            # metadata
+            metadata = result_dict.get("metadata")
+            if not metadata or not metadata:
+                logger.error(f"Firecrawl 未返回metadata/markdown: {scrape_result}")
+                return None
+
+            # 从 metadata中获取title和description
+            title = metadata.get("title")
+            description = metadata.get("description")
+            if not title or not description:
+                logger.error(f"Firecrawl 未返回title/description: {scrape_result}")
+                return None
+        else:
+            logger.error(f"Firecrawl 爬取失败: {scrape_result}")
+            return None
 
-            # 如果tags为非空数组，则使用llm工具处理tags
-            processed_tags = None
+        logger.info(f"url:{url}, title:{title}, description:{description}")
 
-            detail = llm.process_detail(markdown)
-            if tags and detail:
-                processed_tags = llm.process_tags('tag_list is:' + ','.join(tags) + '. content is: ' + detail)
+        # 从firecrawl结果中获取截图URL
+        screenshot_data = None
+        actions = result_dict.get('actions', {})
+        screenshots = actions.get('screenshots', []) if actions else []
 
-            # 循环languages数组， 使用llm工具生成各种语言
-            processed_languages = []
-            if languages:
-                for language in languages:
-                    logger.info("正在处理" + url + "站点，生成" + language + "语言")
-                    processed_title = llm.process_language(language, title)
-                    processed_description = llm.process_language(language, description)
-                    processed_detail = llm.process_language(language, detail)
-                    processed_languages.append({'language': language, 'title': processed_title,
-                                                'description': processed_description, 'detail': processed_detail})
-
-            logger.info(url + "站点处理成功")
-            return {
-                'name': name,
-                'url': url,
-                'title': title,
-                'description': description,
-                'detail': detail,
-                'screenshot_data': screenshot_key,
-                'screenshot_thumbnail_data': thumnbail_key,
-                'tags': processed_tags,
-                'languages': processed_languages,
-            }
+        logger.info(f"截图信息 - actions: {actions}, screenshots: {screenshots}")
+
+        if screenshots and len(screenshots) > 0:
+            try:
+                # 获取第一个截图URL
+                screenshot_url = screenshots[0]
+                logger.info(f"获取到firecrawl截图URL: {screenshot_url}")
+
+                # 下载截图到内存
+                with MetricsUtil.stage('screenshot_download'):
+                    screenshot_data = await HttpUtil.get_bytes(screenshot_url)
+            except Exception as screenshot_error:
+                logger.warning(f"下载firecrawl截图失败: {screenshot_error}")
+        else:
+            logger.warning("firecrawl未返回截图数据")
+
+        return {
+            # 使用firecrawl返回的title作为name
+            'name': title,
+            'url': url,
+            'title': title,
+            'description': description,
+            'content': markdown,
+            'screenshot_data': screenshot_data,
+        }
+
+    async def fetch_by_browser(self, url):
+        # 使用浏览器爬取网页内容并截图；返回页面数据
+        logger.info("使用浏览器爬取")
+
+        with MetricsUtil.stage('fetch_browser'):
+            # 从页面池租用页面，退出时无论成功失败都会释放
+            async with self.browser_pool.page() as page:
+                # 设置用户代理
+                await page.setUserAgent(random.choice(global_agent_headers))
+
+                # 设置页面视口大小并访问具体URL
+                width = 1920  # 默认宽度为 1920
+                height = 1080  # 默认高度为 1080
+                await page.setViewport({'width': width, 'height': height})
+                # 拦截无关资源，分级等待页面可用
+                with MetricsUtil.stage('navigate'):
+                    await self.page_loader.load(page, url)
+
+                # 获取网页内容
+                origin_content = await page.content()
+
+                # 生成网站截图
+                dimensions = await page.evaluate(f'''(width, height) => {{
+                    return {{
+                        width: {width},
+                        height: {height},
+                        deviceScaleFactor: window.devicePixelRatio
+                    }};
+                }}''', width, height)
+                # 截屏并设置图片大小，截图只保存在内存中
+                with MetricsUtil.stage('screenshot'):
+                    screenshot_data = await page.screenshot({'clip': {
+                        'x': 0,
+                        'y': 0,
+                        'width': dimensions['width'],
+                        'height': dimensions['height']
+                    }})
+
+        # 使用lxml抽取title/description和正文markdown，CPU密集操作放到线程池中执行
+        with MetricsUtil.stage('parse'):
+            extracted = await ExecutorUtil.run(extract_util.extract, origin_content)
+        title = extracted['title']
+        description = extracted['description']
+
+        # 根据url提取域名生成name
+        name = CommonUtil.get_name_by_url(url)
+
+        logger.info(f"url:{url}, title:{title},description:{description}")
+
+        return {
+            'name': name,
+            'url': url,
+            'title': title,
+            'description': description,
+            # 正文区域转换后的markdown
+            'content': extracted['content'],
+            'screenshot_data': screenshot_data,
+        }
+
+    @staticmethod
+    async def safe_fetch(fetch, url):
+        try:
+            return await fetch(url)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error("处理" + url + "站点异常，错误信息:", e)
+            logger.error(f"爬取{url}异常，错误信息: {e}")
             return None
-        finally:
-            # 计算程序执行时间
-            execution_time = int(time.time()) - start_time
-            # 输出程序执行时间
-            logger.info("处理" + url + "用时：" + str(execution_time) + " 秒")
 
-
-    # 爬取指定URL网页内容
-    async def scrape_website(self, url, tags, languages):
+    async def fetch_hedged(self, url):
+        domain = CommonUtil.normalize_url(url).split('/')[0]
+        if self.fetch_stats.prefer_browser(domain):
+            # firecrawl在该域名上经常失败，直接使用浏览器
+            logger.info(f"{domain} firecrawl失败率高，直接使用浏览器爬取")
+            page_data = await self.safe_fetch(self.fetch_by_browser, url)
+            self.fetch_stats.record(domain, 'browser', 'win' if page_data is not None else 'fail')
+            return page_data
+
+        tasks = {asyncio.create_task(self.safe_fetch(self.fetch_by_firecrawl, url)): 'firecrawl'}
+        pending = set(tasks)
+        browser_started = False
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=None if browser_started else self.hedge_delay,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    page_data = task.result()
+                    if page_data is not None:
+                        logger.info(f"{tasks[task]}先返回有效结果:{url}")
+                        self.fetch_stats.record(domain, tasks[task], 'win')
+                        for other in pending:
+                            self.fetch_stats.record(domain, tasks[other], 'slow')
+                        return page_data
+                    self.fetch_stats.record(domain, tasks[task], 'fail')
+                if not browser_started:
+                    # firecrawl超过deadline未返回或已失败，启动浏览器爬取
+                    logger.info(f"firecrawl未在{self.hedge_delay}秒内返回有效结果，启动浏览器爬取:{url}")
+                    browser_started = True
+                    task = asyncio.create_task(self.safe_fetch(self.fetch_by_browser, url))
+                    tasks[task] = 'browser'
+                    pending.add(task)
+            return None
+        finally:
+            # 取消未完成的爬取，浏览器页面会在取消时释放
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def process_page(self, page_data, tags, languages, emit=None, fingerprint=None):
+        # 上传截图，使用llm工具生成detail/tags/多语言；emit不为空时每个阶段完成后推送事件 emit(类型, 数据)
+        # fingerprint不为空时为增量爬取：内容未变化时复用上次的LLM结果，截图外观未变化时复用上次的截图
+        url = page_data['url']
+        title = page_data['title']
+        description = page_data['description']
+        if emit:
+            await emit('page', {'name': page_data['name'], 'url': url, 'title': title, 'description': description})
+
+        previous = fingerprint.get('previous') if fingerprint else None
+        reused = {'fetch': False, 'screenshot': False, 'detail': False, 'tags': False, 'languages': []}
+        page_hash = content_hash(title, description, page_data['content']) if fingerprint else None
+        screenshot_hash = None
+
+        screenshot_key = None
+        thumnbail_key = None
+        thumbnail_list = []
+        if page_data['screenshot_data']:
+            if fingerprint:
+                try:
+                    screenshot_hash = await ExecutorUtil.run(image_util.perceptual_hash, page_data['screenshot_data'])
+                except Exception as e:
+                    logger.warning(f"计算截图感知哈希失败: {e}")
+            # 上次截图上传失败（没有截图地址）时不复用，重新上传
+            if previous and previous['result'].get('screenshot_data') and \
+                    self.fingerprints.is_same_screenshot(previous['screenshot_hash'], screenshot_hash):
+                # 外观未变化，沿用上次的哈希，避免多次细微变化累积
+                logger.info(f"{url}截图外观未变化，复用上次的截图")
+                stored = previous['result']
+                screenshot_key = stored.get('screenshot_data')
+                thumnbail_key = stored.get('screenshot_thumbnail_data')
+                thumbnail_list = stored.get('screenshot_thumbnails') or []
+                screenshot_hash = previous['screenshot_hash']
+                reused['screenshot'] = True
+            else:
+                try:
+                    # 上传截图并生成缩略图，返回图片地址
+                    screenshot_key, thumnbail_key, thumbnail_list = await self.upload_screenshot(
+                        url, page_data['screenshot_data'])
+                    logger.info(f"截图上传成功: {screenshot_key}")
+                except Exception as screenshot_error:
+                    logger.warning(f"处理截图失败: {screenshot_error}")
+                    # 不保存截图哈希，下次爬取时重新上传
+                    screenshot_hash = None
+        if emit:
+            await emit('screenshot', {'screenshot_data': screenshot_key, 'screenshot_thumbnail_data': thumnbail_key,
+                                      'screenshot_thumbnails': thumbnail_list})
+
+        content_unchanged = previous is not None and previous['content_hash'] == page_hash
+        # 上次detail生成失败时即使内容未变化也重新生成
+        if content_unchanged and previous['result'].get('detail'):
+            logger.info(f"{url}内容未变化，复用上次的处理结果")
+            detail, processed_tags, processed_languages, language_entries = await self.reuse_llm_results(
+                previous, tags, languages, emit, reused)
+        else:
+            # 使用llm工具处理content生成detail，如果tags为非空数组，同时选出tags（可配置为单次调用）
+            on_detail_delta = None
+            if emit:
+                async def on_detail_delta(text):
+                    await emit('detail_delta', {'text': text})
+            detail, processed_tags = await llm.process_detail_and_tags(page_data['content'], tags, on_detail_delta)
+            if emit:
+                await emit('detail', {'detail': detail})
+                if tags:
+                    await emit('tags', {'tags': processed_tags})
+
+            # 并发处理languages数组， 使用llm工具生成各种语言
+            if languages:
+                logger.info("正在处理" + url + "站点，生成" + ','.join(languages) + "语言")
+            on_language = None
+            if emit:
+                async def on_language(entry):
+                    await emit('language', entry)
+            processed_languages = await llm.process_languages(languages, title, description, detail, on_language)
+            language_entries = {entry['language']: entry for entry in processed_languages}
+
+        logger.info(url + "站点处理成功")
+        result = {
+            'name': page_data['name'],
+            'url': url,
+            'title': title,
+            'description': description,
+            'detail': detail,
+            'screenshot_data': screenshot_key,
+            'screenshot_thumbnail_data': thumnbail_key,
+            'screenshot_thumbnails': thumbnail_list,
+            'tags': processed_tags,
+            'languages': processed_languages,
+        }
+        if fingerprint:
+            await self.save_fingerprint(url, fingerprint, page_hash, screenshot_hash, tags, result, language_entries,
+                                        content_unchanged)
+            result['reused'] = reused
+        return result
+
+    async def reuse_llm_results(self, previous, tags, languages, emit, reused):
+        # 内容未变化且上次的detail不为空：复用上次的detail、tags和已有语言的翻译，只补齐tag_list变化后
+        # 或上次为空的tags与新增的语言；返回 (detail, tags, languages, 所有已知语言的翻译)
+        stored = previous['result']
+        detail = stored.get('detail')
+        reused['detail'] = True
+        if emit:
+            await emit('detail', {'detail': detail})
+
+        processed_tags = None
+        if tags:
+            if stored.get('tags') and sorted(previous['tag_list'] or []) == sorted(tags):
+                processed_tags = stored['tags']
+                reused['tags'] = True
+            elif detail:
+                processed_tags = await llm.process_tags('tag_list is:' + ','.join(tags) + '. content is: ' + detail)
+            if emit:
+                await emit('tags', {'tags': processed_tags})
+
+        # 只复用所有字段都翻译成功的语言
+        language_entries = {entry['language']: entry for entry in stored.get('languages') or []
+                            if all(entry.get(field) or not stored.get(field)
+                                   for field in ('title', 'description', 'detail'))}
+        requested = list(dict.fromkeys(languages or []))
+        reused['languages'] = [language for language in requested if language in language_entries]
+        if emit:
+            for language in reused['languages']:
+                await emit('language', language_entries[language])
+
+        on_language = None
+        if emit:
+            async def on_language(entry):
+                await emit('language', entry)
+        missing = [language for language in requested if language not in language_entries]
+        translated = await llm.process_languages(missing, stored.get('title'), stored.get('description'), detail,
+                                                 on_language)
+        language_entries.update({entry['language']: entry for entry in translated})
+        return detail, processed_tags, [language_entries[language] for language in languages or []], language_entries
+
+    async def save_fingerprint(self, url, fingerprint, page_hash, screenshot_hash, tags, result, language_entries,
+                               content_unchanged):
+        # 保存本次指纹与结果；保存所有已知语言的翻译，本次未选择tags且内容未变化时保留上次的tags
+        previous = fingerprint.get('previous')
+        stored_result = dict(result, languages=list(language_entries.values()))
+        tag_list = tags
+        if not tags and content_unchanged:
+            tag_list = previous['tag_list']
+            stored_result['tags'] = previous['result'].get('tags')
+        try:
+            await ExecutorUtil.run(self.fingerprints.save, url, fingerprint.get('etag'), fingerprint.get('last_modified'),
+                                   page_hash, screenshot_hash, tag_list, stored_result)
+        except Exception as e:
+            logger.warning(f"保存{url}站点指纹失败: {e}")
+
+    async def preflight(self, url, previous):
+        # HEAD请求获取ETag/Last-Modified，有上次的指纹时带上条件请求头；返回 (是否未变化, etag, last_modified)
+        headers = {'User-Agent': random.choice(global_agent_headers)}
+        if previous and previous['etag']:
+            headers['If-None-Match'] = previous['etag']
+        if previous and previous['last_modified']:
+            headers['If-Modified-Since'] = previous['last_modified']
+        try:
+            with MetricsUtil.stage('preflight'):
+                response = await HttpUtil.get_client().head(url, headers=headers,
+                                                            timeout=self.fingerprints.preflight_timeout)
+        except Exception as e:
+            logger.info(f"预检请求失败，不影响继续爬取:{url}, {e}")
+            return False, None, None
+
+        if previous and response.status_code == 304:
+            return True, previous['etag'], previous['last_modified']
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status_code >= 400 or not previous:
+            return False, etag, last_modified
+        # 优先比较ETag，没有ETag时比较Last-Modified
+        if etag:
+            unchanged = etag == previous['etag']
+        else:
+            unchanged = bool(last_modified) and last_modified == previous['last_modified']
+        return unchanged, etag, last_modified
+
+    async def reuse_page(self, fingerprint, tags, languages, emit=None):
+        # 预检确认页面未变化：不再爬取页面，直接复用上次的结果
+        previous = fingerprint['previous']
+        stored = previous['result']
+        reused = {'fetch': True, 'screenshot': True, 'detail': False, 'tags': False, 'languages': []}
+        if emit:
+            await emit('page', {key: stored.get(key) for key in ('name', 'url', 'title', 'description')})
+            await emit('screenshot', {key: stored.get(key) for key in ('screenshot_data', 'screenshot_thumbnail_data',
+                                                                       'screenshot_thumbnails')})
+        detail, processed_tags, processed_languages, language_entries = await self.reuse_llm_results(
+            previous, tags, languages, emit, reused)
+        result = dict(stored, detail=detail, tags=processed_tags, languages=processed_languages)
+        await self.save_fingerprint(stored['url'], fingerprint, previous['content_hash'], previous['screenshot_hash'],
+                                    tags, result, language_entries, True)
+        result['reused'] = reused
+        return result
+
+    async def scrape(self, url, tags, languages, fetch, emit=None, incremental=False):
         # 开始爬虫处理
+        start_time = time.time()
         try:
-            # 记录程序开始时间
-            start_time = int(time.time())
             logger.info("正在处理：" + url)
-            logger.info("使用浏览器爬取")
             if not url.startswith('http://') and not url.startswith('https://'):
                 url = 'https://' + url
 
-            if self.browser is None:
-                self.browser = await launch(headless=True,
-                                            ignoreDefaultArgs=["--enable-automation"],
-                                            ignoreHTTPSErrors=True,
-                                            args=['--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu',
-                                                  '--disable-software-rasterizer', '--disable-setuid-sandbox'],
-                                            handleSIGINT=False, handleSIGTERM=False, handleSIGHUP=False)
-
-            page = await self.browser.newPage()
-            # 设置用户代理
-            await page.setUserAgent(random.choice(global_agent_headers))
-
-            # 设置页面视口大小并访问具体URL
-            width = 1920  # 默认宽度为 1920
-            height = 1080  # 默认高度为 1080
-            await page.setViewport({'width': width, 'height': height})
-            try:
-                await page.goto(url, {'timeout': 60000, 'waitUntil': ['load', 'networkidle2']})
-            except Exception as e:
-                logger.info(f'页面加载超时,不影响继续执行后续流程:{e}')
-
-            # 获取网页内容
-            origin_content = await page.content()
-            soup = BeautifulSoup(origin_content, 'html.parser')
-
-            # 通过标签名提取内容
-            title = soup.title.string.strip() if soup.title else ''
-
-            # 根据url提取域名生成name
-            name = CommonUtil.get_name_by_url(url)
-
-            # 获取网页描述
-            description = ''
-            meta_description = soup.find('meta', attrs={'name': 'description'})
-            if meta_description:
-                description = meta_description['content'].strip()
-
-            if not description:
-                meta_description = soup.find('meta', attrs={'property': 'og:description'})
-                description = meta_description['content'].strip() if meta_description else ''
-
-            logger.info(f"url:{url}, title:{title},description:{description}")
-
-            # 生成网站截图
-            image_key = oss.get_default_file_key(url)
-            dimensions = await page.evaluate(f'''(width, height) => {{
-                return {{
-                    width: {width},
-                    height: {height},
-                    deviceScaleFactor: window.devicePixelRatio
-                }};
-            }}''', width, height)
-            # 截屏并设置图片大小
-            screenshot_path = './' + url.replace("https://", "").replace("http://", "").replace("/", "").replace(".",
-                                                                                                                 "-") + '.png'
-            await page.screenshot({'path': screenshot_path, 'clip': {
-                'x': 0,
-                'y': 0,
-                'width': dimensions['width'],
-                'height': dimensions['height']
-            }})
-            # 上传图片，返回图片地址
-            screenshot_key = oss.upload_file_to_r2(screenshot_path, image_key)
-
-            # 生成缩略图
-            thumnbail_key = oss.generate_thumbnail_image(url, image_key)
-
-            # 抓取整个网页内容
-            content = soup.get_text()
-
-            # 使用llm工具处理content
-            detail = llm.process_detail(content)
-            await page.close()
-
-            # 如果tags为非空数组，则使用llm工具处理tags
-            processed_tags = None
-            if tags and detail:
-                processed_tags = llm.process_tags('tag_list is:' + ','.join(tags) + '. content is: ' + detail)
-
-            # 循环languages数组， 使用llm工具生成各种语言
-            processed_languages = []
-            if languages:
-                for language in languages:
-                    logger.info("正在处理" + url + "站点，生成" + language + "语言")
-                    processed_title = llm.process_language(language, title)
-                    processed_description = llm.process_language(language, description)
-                    processed_detail = llm.process_language(language, detail)
-                    processed_languages.append({'language': language, 'title': processed_title,
-                                                'description': processed_description, 'detail': processed_detail})
-
-            logger.info(url + "站点处理成功")
-            return {
-                'name': name,
-                'url': url,
-                'title': title,
-                'description': description,
-                'detail': detail,
-                'screenshot_data': screenshot_key,
-                'screenshot_thumbnail_data': thumnbail_key,
-                'tags': processed_tags,
-                'languages': processed_languages,
-            }
+            # 增量爬取：读取上次的指纹，预检确认页面未变化时直接复用上次的结果
+            fingerprint = None
+            if incremental:
+                previous = await ExecutorUtil.run(self.fingerprints.get, url)
+                fingerprint = {'previous': previous}
+                if self.fingerprints.preflight_enabled:
+                    unchanged, etag, last_modified = await self.preflight(url, previous)
+                    fingerprint.update(etag=etag, last_modified=last_modified)
+                    # 上次的detail或截图为空时重新爬取，不复用不完整的结果
+                    if unchanged and previous['result'].get('detail') and previous['result'].get('screenshot_data'):
+                        logger.info(f"{url}预检未变化，复用上次的结果")
+                        return await self.reuse_page(fingerprint, tags, languages, emit)
+
+            page_data = await fetch(url)
+            if page_data is None:
+                return None
+            return await self.process_page(page_data, tags, languages, emit, fingerprint)
         except Exception as e:
-            logger.error("处理" + url + "站点异常，错误信息:", e)
+            logger.error(f"处理{url}站点异常，错误信息: {e}")
             return None
         finally:
             # 计算程序执行时间
-            execution_time = int(time.time()) - start_time
+            execution_time = int(time.time() - start_time)
             # 输出程序执行时间
             logger.info("处理" + url + "用时：" + str(execution_time) + " 秒")
+
+    async def scrape_website_by_firecrawl(self, url, tags, languages, emit=None, incremental=False):
+        return await self.scrape(url, tags, languages, self.fetch_by_firecrawl, emit, incremental)
+
+    # 爬取指定URL网页内容
+    async def scrape_website(self, url, tags, languages, emit=None, incremental=False):
+        return await self.scrape(url, tags, languages, self.fetch_by_browser, emit, incremental)
+
+    # 对冲模式爬取：firecrawl与浏览器竞速
+    async def scrape_website_hedged(self, url, tags, languages, emit=None, incremental=False):
+        return await self.scrape(url, tags, languages, self.fetch_hedged, emit, incremental)